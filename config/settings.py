@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 import os
 from datetime import timedelta
 from pathlib import Path
+from celery.schedules import crontab
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -147,7 +148,7 @@ SUPERUSER_TELEGRAM_CHAT_ID = os.getenv('SUPERUSER_TELEGRAM_CHAT_ID')
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
@@ -156,14 +157,78 @@ REST_FRAMEWORK = {
 
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(days=1),
+    "TOKEN_OBTAIN_SERIALIZER": "users.serializers.UserTokenObtainPairSerializer",
 }
 
+AUTH_PRINCIPAL_CACHE_TIMEOUT = 300
+AUTH_PRINCIPAL_LOCAL_CACHE_TIMEOUT = 5
+AUTH_PRINCIPAL_LOCAL_CACHE_SIZE = 10000
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://localhost:6379/1',
+    }
+}
+
+CACHE_VERSION_TIMEOUT = 60 * 60 * 24 * 7
+CACHE_LOCK_TIMEOUT = 10
+CACHE_STALE_TIMEOUT = 30
+
+REFERENCE_CACHE_SIZE = 1000
+REFERENCE_CACHE_CHECK_INTERVAL = 1
+
 CELERY_BROKER_URL = 'redis://localhost:6379'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379'
 CELERY_TIMEZONE = 'Europe/Moscow'
+CELERY_BEAT_SCHEDULE = {
+    'dispatch-due-habits': {
+        'task': 'habit.tasks.dispatch_due_habits',
+        'schedule': crontab(),
+    },
+    'reconcile-schedules': {
+        'task': 'habit.tasks.reconcile_schedules',
+        'schedule': crontab(minute=0),
+    },
+    'precompute-adherence-reports': {
+        'task': 'habit.tasks.precompute_adherence_reports',
+        'schedule': crontab(hour=3, minute=0),
+    },
+}
+
+HABIT_DISPATCH_BATCH_SIZE = 1000
+HABIT_REMINDER_CACHE_TTL = 60
+HABIT_DIGEST_WINDOW = 1
+HABIT_IDEMPOTENCY_TTL = 60 * 60 * 24
+HABIT_RECONCILE_BATCH_SIZE = 5000
+HABIT_RECONCILE_GRACE = 10
+HABIT_BULK_MAX_SIZE = 100
+HABIT_RESCHEDULE_DELAY = 5
+HABIT_PUBLIC_FEED_TIMEOUT = 60
+HABIT_FAST_SERIALIZATION = False
+HABIT_EXPORT_CHUNK_SIZE = 2000
+HABIT_REPORT_WEEKS = 52
+HABIT_REPORT_TIMEOUT = 60 * 60 * 24
+HABIT_REPORT_BATCH_SIZE = 500
+HABIT_AGENDA_MAX_DAYS = 31
 
 BOT_API_TOKEN = os.getenv('BOT_API_TOKEN')
 
+TELEGRAM_API_URL = 'https://api.telegram.org'
+TELEGRAM_TRANSPORT = 'habit.telegram.RequestsTransport'
+TELEGRAM_TIMEOUT = 10
+TELEGRAM_POOL_SIZE = 10
+TELEGRAM_GLOBAL_RATE = 30
+TELEGRAM_CHAT_RATE = 1
+TELEGRAM_BATCH_SIZE = 100
+TELEGRAM_MAX_RETRIES = 5
+TELEGRAM_RETRY_BACKOFF = 10
+TELEGRAM_RETRY_BACKOFF_MAX = 600
+TELEGRAM_BREAKER_THRESHOLD = 5
+TELEGRAM_BREAKER_RESET_TIMEOUT = 30
+
+HABIT_DELIVERY_CONCURRENCY = 100
+
 CORS_ALLOWED_ORIGINS = [
     "https://read-only.example.com",
     "https://read-and-write.example.com",
@@ -1,3 +1,40 @@
 from django.contrib import admin
 
-# Register your models here.
+from habit.models import Place, Action, Habit, HabitCompletion, DeadLetter
+from habit.tasks import replay_dead_letters
+
+
+@admin.register(Place)
+class PlaceAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'name')
+
+
+@admin.register(Action)
+class ActionAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'name')
+
+
+@admin.register(Habit)
+class HabitAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'owner', 'action', 'place', 'time', 'pleasure_habit', 'is_pleasure', 'is_public')
+    list_select_related = ('owner', 'place', 'action', 'pleasure_habit__action')
+    list_filter = ('is_pleasure', 'is_public')
+    raw_id_fields = ('owner', 'pleasure_habit')
+
+
+@admin.register(HabitCompletion)
+class HabitCompletionAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'habit', 'day', 'completed_at')
+    list_select_related = ('habit__action',)
+    raw_id_fields = ('habit',)
+
+
+@admin.register(DeadLetter)
+class DeadLetterAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'chat_id', 'status_code', 'error', 'attempts', 'created_at')
+    list_filter = ('status_code',)
+    actions = ('replay',)
+
+    @admin.action(description='Повторить отправку')
+    def replay(self, request, queryset):
+        self.message_user(request, f'Отправлено повторно: {replay_dead_letters(queryset)}')
@@ -0,0 +1,97 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+def get_version(name):
+    key = f'version:{name}'
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time()), settings.CACHE_VERSION_TIMEOUT)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name):
+    bump_versions([name])
+
+
+def get_versions(names):
+    versions = cache.get_many([f'version:{name}' for name in names])
+    return [versions.get(f'version:{name}') for name in names]
+
+
+def add_versions(names):
+    now = int(time.time())
+    return [name for name in names if cache.add(f'version:{name}', now, settings.CACHE_VERSION_TIMEOUT)]
+
+
+def delete_versions(names):
+    cache.delete_many([f'version:{name}' for name in names])
+
+
+def bump_versions(names):
+    keys = [f'version:{name}' for name in names]
+    versions = cache.get_many(keys)
+    now = int(time.time())
+    cache.set_many({key: max(now, versions.get(key, 0) + 1) for key in keys}, settings.CACHE_VERSION_TIMEOUT)
+
+
+def get_or_compute(key, compute, timeout):
+    entry = cache.get(key)
+    if entry is not None and entry[1] > time.time():
+        return entry[0]
+
+    lock = f'{key}:lock'
+    if cache.add(lock, True, settings.CACHE_LOCK_TIMEOUT):
+        try:
+            value = compute()
+            cache.set(key, (value, time.time() + timeout), timeout + settings.CACHE_STALE_TIMEOUT)
+            return value
+        finally:
+            cache.delete(lock)
+
+    if entry is not None:
+        return entry[0]
+    deadline = time.monotonic() + settings.CACHE_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+    return compute()
+
+
+def invalidate_public_feed():
+    transaction.on_commit(lambda: bump_version('public-feed'))
+
+
+def get_habit_version_names(habits):
+    return {f'habit:{habit.pk}' for habit in habits} | {f'habit:{habit.owner_id}:{habit.pk}' for habit in habits}
+
+
+def invalidate_reports(habits):
+    names = {f'completions:{habit.owner_id}' for habit in habits}
+    transaction.on_commit(lambda: bump_versions(names))
+
+
+def invalidate_habits(habits):
+    names = {f'habits:{habit.owner_id}' for habit in habits} | get_habit_version_names(habits)
+    if any(habit.is_public for habit in habits):
+        names.add('public-feed')
+    transaction.on_commit(lambda: bump_versions(names))
+
+
+def forget_habits(habits):
+    detail_names = get_habit_version_names(habits)
+    names = {f'habits:{habit.owner_id}' for habit in habits}
+    if any(habit.is_public for habit in habits):
+        names.add('public-feed')
+
+    def forget():
+        delete_versions(detail_names)
+        bump_versions(names)
+
+    transaction.on_commit(forget)
@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+import httpx
+from django.conf import settings
+
+from habit.metrics import observe
+from habit.telegram import TokenBucket, CircuitBreaker, DeliveryResult, make_result, get_breaker
+
+
+class AsyncDeliveryEngine:
+    def __init__(self, api_url, token, concurrency, timeout, global_rate, chat_rate, breaker=None):
+        self.url = f'{api_url}/bot{token}/sendMessage'
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.chat_rate = chat_rate
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_buckets = {}
+        self.breaker = breaker or CircuitBreaker(threshold=5, reset_timeout=30)
+        self.client = None
+        self.durations = []
+
+    def get_client(self):
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+            )
+        return self.client
+
+    async def acquire(self, bucket):
+        delay = bucket.consume()
+        while delay:
+            await asyncio.sleep(delay)
+            delay = bucket.consume()
+
+    async def send(self, message):
+        remaining = self.breaker.remaining()
+        if remaining:
+            return DeliveryResult(message['chat_id'], error='Telegram API недоступен', retry_after=remaining)
+        if message['chat_id'] not in self.chat_buckets:
+            self.chat_buckets[message['chat_id']] = TokenBucket(self.chat_rate)
+        await self.acquire(self.chat_buckets[message['chat_id']])
+        await self.acquire(self.global_bucket)
+        started = time.monotonic()
+        try:
+            response = await self.get_client().post(
+                self.url, data={'chat_id': message['chat_id'], 'text': message['text']})
+        except httpx.HTTPError as error:
+            result = DeliveryResult(message['chat_id'], error=repr(error))
+        else:
+            self.durations.append(time.monotonic() - started)
+            try:
+                payload = response.json()
+            except ValueError:
+                payload = {}
+            result = make_result(message['chat_id'], response.status_code, payload)
+        self.breaker.record(result)
+        return result
+
+    async def worker(self, queue, results):
+        while not queue.empty():
+            index, message = queue.get_nowait()
+            results[index] = await self.send(message)
+
+    async def deliver(self, messages):
+        queue = asyncio.Queue()
+        for index, message in enumerate(messages):
+            queue.put_nowait((index, message))
+        results = [None] * len(messages)
+        await asyncio.gather(*(
+            self.worker(queue, results) for _ in range(min(self.concurrency, len(messages)))
+        ))
+        self.chat_buckets = {key: bucket for key, bucket in self.chat_buckets.items() if not bucket.is_full()}
+        observe('habit_telegram_send_seconds', self.durations)
+        self.durations = []
+        return results
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+        self.client = None
+
+
+def get_engine():
+    return AsyncDeliveryEngine(
+        api_url=settings.TELEGRAM_API_URL,
+        token=settings.BOT_API_TOKEN,
+        concurrency=settings.HABIT_DELIVERY_CONCURRENCY,
+        timeout=settings.TELEGRAM_TIMEOUT,
+        global_rate=settings.TELEGRAM_GLOBAL_RATE,
+        chat_rate=settings.TELEGRAM_CHAT_RATE,
+        breaker=get_breaker(),
+    )
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from habit.models import Place, Action, Habit
+from habit.serializers import HabitSerializer
+
+
+class Command(BaseCommand):
+    help = 'Измеряет стоимость валидации привычек по одной и пакетом'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=100, help='Количество привычек в пакете')
+        parser.add_argument('--repeat', type=int, default=10, help='Количество повторов')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            place = Place.objects.create(name='benchmark')
+            action = Action.objects.create(name='benchmark')
+            pleasure_habit = Habit.objects.create(place=place, action=action, is_pleasure=True)
+            data = [
+                {'place': place.pk, 'action': action.pk, 'pleasure_habit': pleasure_habit.pk, 'periodicity': 1}
+                for _ in range(options['size'])
+            ]
+            self.measure('По одной', options['repeat'], lambda: [
+                HabitSerializer(data=item).is_valid(raise_exception=True) for item in data
+            ])
+            self.measure('Пакетом', options['repeat'], lambda: HabitSerializer(data=data, many=True).is_valid(
+                raise_exception=True))
+            transaction.set_rollback(True)
+
+    def measure(self, name, repeat, validate):
+        with CaptureQueriesContext(connection) as context:
+            validate()
+        started = time.perf_counter()
+        for _ in range(repeat):
+            validate()
+        elapsed = (time.perf_counter() - started) / repeat
+        self.stdout.write(f'{name}: {elapsed * 1000:.2f} мс, запросов: {len(context)}')
@@ -0,0 +1,57 @@
+import re
+from datetime import timedelta
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from habit.models import Place, Action, Habit
+from habit.queries import HOT_QUERIES
+from users.models import User
+
+SEQUENTIAL_SCAN = re.compile(rf'Seq Scan on {Habit._meta.db_table}\b|\bSCAN {Habit._meta.db_table}\b(?! USING)')
+
+
+class Command(BaseCommand):
+    help = 'Проверяет планы выполнения основных запросов к привычкам на последовательное сканирование'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='Количество тестовых привычек, удаляются после проверки')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            owner_id = self.seed(options['seed']) if options['seed'] else Habit.objects.values_list(
+                'owner_id', flat=True).first()
+            flagged = [name for name, query in HOT_QUERIES.items() if not self.check_plan(name, query(owner_id))]
+            transaction.set_rollback(True)
+        if flagged:
+            raise CommandError(f'Последовательное сканирование в запросах: {", ".join(flagged)}')
+
+    def check_plan(self, name, queryset):
+        plan = queryset.explain()
+        scans = [line.strip() for line in plan.splitlines() if SEQUENTIAL_SCAN.search(line)]
+        self.stdout.write(f'{name}: {"последовательное сканирование" if scans else "OK"}')
+        for line in scans:
+            self.stdout.write(f'    {line}')
+        return not scans
+
+    def seed(self, count):
+        users = User.objects.bulk_create([
+            User(email=f'query-plan-{number}@example.com') for number in range(max(count // 10, 1))
+        ])
+        place = Place.objects.create(name='query-plan')
+        action = Action.objects.create(name='query-plan')
+        now = timezone.now()
+        Habit.objects.bulk_create(
+            [
+                Habit(owner=users[number % len(users)], place=place, action=action, reward='query-plan',
+                      is_pleasure=number % 5 == 0, is_public=number % 20 == 0,
+                      next_run=None if number % 5 == 0 else now + timedelta(minutes=number % 1440))
+                for number in range(count)
+            ],
+            batch_size=5000,
+        )
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE {Habit._meta.db_table}')
+        return users[0].pk
@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from habit.delivery import get_engine
+from habit.services import collect_due_habits, build_messages, release_messages, store_dead_letters, \
+    record_delivery, get_retry_countdown
+
+
+class Command(BaseCommand):
+    help = 'Рассылает наступившие напоминания через asyncio без воркеров celery'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Выполнить один проход и завершиться')
+
+    def handle(self, *args, **options):
+        self.engine = get_engine()
+        self.loop = asyncio.new_event_loop()
+        self.deferred = []
+        try:
+            while True:
+                self.sent = self.failed = 0
+                for habits in collect_due_habits():
+                    self.deliver([(habit.pk, habit.due_at.isoformat()) for habit in habits], attempts=0)
+                self.deliver_deferred()
+                self.stdout.write(f'Отправлено: {self.sent}, отложено: {len(self.deferred)}, ошибок: {self.failed}')
+                if options['once']:
+                    break
+                time.sleep(self.get_sleep_time())
+        finally:
+            for ready_at, attempts, failures in self.deferred:
+                store_dead_letters(failures, attempts=attempts)
+            self.loop.run_until_complete(self.engine.close())
+            self.loop.close()
+
+    def deliver(self, reminders, attempts):
+        messages = build_messages(reminders)
+        results = self.loop.run_until_complete(self.engine.deliver(messages))
+        record_delivery(messages, results)
+        failures = [(message, result) for message, result in zip(messages, results) if not result.ok]
+        release_messages([message for message, result in failures])
+
+        can_retry = attempts < settings.TELEGRAM_MAX_RETRIES
+        retryable = [(message, result) for message, result in failures if can_retry and result.retryable]
+        store_dead_letters(
+            [(message, result) for message, result in failures if not (can_retry and result.retryable)],
+            attempts=attempts + 1,
+        )
+        if retryable:
+            countdown = get_retry_countdown(attempts, [result for message, result in retryable])
+            self.deferred.append((time.monotonic() + countdown, attempts + 1, retryable))
+        self.sent += len(results) - len(failures)
+        self.failed += len(failures) - len(retryable)
+        for message, result in failures:
+            self.stderr.write(f'Чат {result.chat_id}: {result.status_code} {result.error}')
+
+    def deliver_deferred(self):
+        while True:
+            now = time.monotonic()
+            ready = [entry for entry in self.deferred if entry[0] <= now]
+            if not ready:
+                return
+            self.deferred = [entry for entry in self.deferred if entry[0] > now]
+            for ready_at, attempts, failures in ready:
+                self.deliver([reminder for message, result in failures for reminder in message['reminders']],
+                             attempts=attempts)
+
+    def get_sleep_time(self):
+        sleep_time = 60 - time.time() % 60
+        if self.deferred:
+            sleep_time = min(sleep_time, min(ready_at for ready_at, attempts, failures in self.deferred)
+                             - time.monotonic())
+        return max(sleep_time, 0)
@@ -0,0 +1,27 @@
+from django.core.management import BaseCommand
+
+from habit.metrics import HISTOGRAMS, COUNTERS, get_histogram, get_quantile, get_throughput
+
+
+class Command(BaseCommand):
+    help = 'Выводит сводку по задержкам и пропускной способности рассылки напоминаний'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--minutes', type=int, default=10, help='Количество минут для пропускной способности')
+
+    def handle(self, *args, **options):
+        for name, description in HISTOGRAMS.items():
+            histogram = get_histogram(name)
+            if not histogram['count']:
+                self.stdout.write(f'{description}: нет данных')
+                continue
+            self.stdout.write(
+                f"{description}: количество {histogram['count']}, "
+                f"среднее {histogram['sum'] / histogram['count']:.3f} с, "
+                f"p50 <= {get_quantile(histogram, 0.5)} с, "
+                f"p95 <= {get_quantile(histogram, 0.95)} с, "
+                f"p99 <= {get_quantile(histogram, 0.99)} с"
+            )
+        for name, description in COUNTERS.items():
+            throughput = ', '.join(f'{minute}: {value}' for minute, value in get_throughput(name, options['minutes']))
+            self.stdout.write(f'{description} по минутам: {throughput}')
@@ -0,0 +1,17 @@
+from django.core.management import BaseCommand
+
+from habit.services import reconcile_schedules
+
+
+class Command(BaseCommand):
+    help = 'Сверяет расписание напоминаний с привычками и исправляет расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Размер пакета обновления')
+
+    def handle(self, *args, **options):
+        counts = reconcile_schedules(batch_size=options['batch_size'])
+        self.stdout.write(
+            f"Создано: {counts['missing']}, исправлено: {counts['stale']}, удалено: {counts['orphaned']}, "
+            f"время: {counts['seconds']} с"
+        )
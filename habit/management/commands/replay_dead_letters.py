@@ -0,0 +1,17 @@
+from django.core.management import BaseCommand
+
+from habit.models import DeadLetter
+from habit.tasks import replay_dead_letters
+
+
+class Command(BaseCommand):
+    help = 'Повторно отправляет недоставленные напоминания'
+
+    def add_arguments(self, parser):
+        parser.add_argument('ids', nargs='*', type=int, help='Идентификаторы записей, по умолчанию все')
+
+    def handle(self, *args, **options):
+        queryset = DeadLetter.objects.all()
+        if options['ids']:
+            queryset = queryset.filter(pk__in=options['ids'])
+        self.stdout.write(f'Отправлено повторно: {replay_dead_letters(queryset)}')
@@ -0,0 +1,113 @@
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+
+HISTOGRAMS = {
+    'habit_schedule_update_seconds': 'Время обновления расписания привычки',
+    'habit_reminder_queue_wait_seconds': 'Время ожидания задачи рассылки в очереди',
+    'habit_reminder_lag_seconds': 'Задержка отправки напоминания относительно запланированного времени',
+    'habit_telegram_send_seconds': 'Время запроса к Telegram API',
+}
+
+COUNTERS = {
+    'habit_reminders_sent': 'Отправленные напоминания',
+    'habit_reminders_failed': 'Неотправленные напоминания',
+}
+
+RETENTION = 60 * 60 * 48
+
+
+def increment(key, delta=1, timeout=None):
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        if not cache.add(key, delta, timeout):
+            cache.incr(key, delta)
+
+
+def get_bucket(value):
+    return next((index for index, bound in enumerate(BUCKETS) if value <= bound), len(BUCKETS))
+
+
+def observe(name, values):
+    counts = {}
+    for value in values:
+        bucket = get_bucket(value)
+        counts[bucket] = counts.get(bucket, 0) + 1
+    if not counts:
+        return
+    for bucket, count in counts.items():
+        increment(f'metrics:{name}:bucket:{bucket}', count)
+    increment(f'metrics:{name}:count', len(values))
+    increment(f'metrics:{name}:sum_ms', int(sum(values) * 1000))
+
+
+@contextmanager
+def timer(name):
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        observe(name, [time.monotonic() - started])
+
+
+def get_minute(moment=None):
+    return (moment or timezone.now()).strftime('%Y%m%d%H%M')
+
+
+def count(name, value=1):
+    if value:
+        increment(f'metrics:{name}:total', value)
+        increment(f'metrics:{name}:minute:{get_minute()}', value, RETENTION)
+
+
+def get_histogram(name):
+    keys = [f'metrics:{name}:bucket:{bucket}' for bucket in range(len(BUCKETS) + 1)]
+    values = cache.get_many(keys + [f'metrics:{name}:count', f'metrics:{name}:sum_ms'])
+    return {
+        'buckets': [values.get(key, 0) for key in keys],
+        'count': values.get(f'metrics:{name}:count', 0),
+        'sum': values.get(f'metrics:{name}:sum_ms', 0) / 1000,
+    }
+
+
+def get_quantile(histogram, quantile):
+    if not histogram['count']:
+        return None
+    threshold = histogram['count'] * quantile
+    total = 0
+    for bound, value in zip(BUCKETS + (float('inf'),), histogram['buckets']):
+        total += value
+        if total >= threshold:
+            return bound
+
+
+def get_throughput(name, minutes):
+    now = timezone.now()
+    moments = [get_minute(now - timedelta(minutes=minute)) for minute in range(minutes)]
+    values = cache.get_many([f'metrics:{name}:minute:{moment}' for moment in moments])
+    return [(moment, values.get(f'metrics:{name}:minute:{moment}', 0)) for moment in moments]
+
+
+def render_prometheus():
+    lines = []
+    for name, description in HISTOGRAMS.items():
+        histogram = get_histogram(name)
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+        total = 0
+        for bound, value in zip(BUCKETS + ('+Inf',), histogram['buckets']):
+            total += value
+            lines.append(f'{name}_bucket{{le="{bound}"}} {total}')
+        lines += [f'{name}_sum {histogram["sum"]}', f'{name}_count {histogram["count"]}']
+    for name, description in COUNTERS.items():
+        lines += [
+            f'# HELP {name}_total {description}',
+            f'# TYPE {name}_total counter',
+            f'{name}_total {cache.get(f"metrics:{name}:total", 0)}',
+        ]
+    return '\n'.join(lines) + '\n'
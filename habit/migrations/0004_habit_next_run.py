@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:00
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fill_next_run(apps, schema_editor):
+    Habit = apps.get_model('habit', 'Habit')
+    PeriodicTask = apps.get_model('django_celery_beat', 'PeriodicTask')
+
+    now = timezone.now()
+    habits = list(Habit.objects.filter(is_pleasure=False).only('pk', 'time', 'periodicity'))
+    for habit in habits:
+        period = timedelta(days=max(habit.periodicity, 1))
+        habit.next_run = habit.time + period * max(-((habit.time - now) // period), 0)
+    Habit.objects.bulk_update(habits, ['next_run'], batch_size=1000)
+
+    PeriodicTask.objects.filter(task='habits.tasks.send_telegram_message').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habit', '0003_rename_user_habit_owner'),
+        ('django_celery_beat', '0018_improve_crontab_helptext'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habit',
+            name='next_run',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='время следующего напоминания'),
+        ),
+        migrations.RunPython(fill_next_run, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habit', '0004_habit_next_run'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeadLetter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chat_id', models.BigIntegerField(verbose_name='telegram_chat_id')),
+                ('text', models.TextField(verbose_name='текст сообщения')),
+                ('reminders', models.JSONField(default=list, verbose_name='напоминания')),
+                ('status_code', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='код ответа')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='ошибка')),
+                ('attempts', models.PositiveSmallIntegerField(default=1, verbose_name='количество попыток')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='дата создания')),
+            ],
+            options={
+                'verbose_name': 'недоставленное напоминание',
+                'verbose_name_plural': 'недоставленные напоминания',
+                'ordering': ('pk',),
+            },
+        ),
+    ]
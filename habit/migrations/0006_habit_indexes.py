@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:26
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('habit', '0005_deadletter'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='habit',
+            name='next_run',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='время следующего напоминания'),
+        ),
+        migrations.AlterField(
+            model_name='habit',
+            name='owner',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='habit', to=settings.AUTH_USER_MODEL, verbose_name='пользователь'),
+        ),
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(fields=['owner', 'id'], name='habit_owner_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(condition=models.Q(('is_public', True)), fields=['id'], name='habit_public_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(condition=models.Q(('is_pleasure', False)), fields=['next_run'], name='habit_next_run_idx'),
+        ),
+    ]
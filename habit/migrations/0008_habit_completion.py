@@ -0,0 +1,52 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habit', '0007_habit_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habit',
+            name='completion_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='количество выполнений'),
+        ),
+        migrations.AddField(
+            model_name='habit',
+            name='current_streak',
+            field=models.PositiveIntegerField(default=0, verbose_name='текущая серия'),
+        ),
+        migrations.AddField(
+            model_name='habit',
+            name='last_completed_on',
+            field=models.DateField(blank=True, null=True, verbose_name='дата последнего выполнения'),
+        ),
+        migrations.AddField(
+            model_name='habit',
+            name='longest_streak',
+            field=models.PositiveIntegerField(default=0, verbose_name='лучшая серия'),
+        ),
+        migrations.CreateModel(
+            name='HabitCompletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='день выполнения')),
+                ('completed_at', models.DateTimeField(auto_now_add=True, verbose_name='время отметки')),
+                ('habit', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='completions', to='habit.habit', verbose_name='привычка')),
+            ],
+            options={
+                'verbose_name': 'выполнение привычки',
+                'verbose_name_plural': 'выполнения привычек',
+                'ordering': ('pk',),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='habitcompletion',
+            constraint=models.UniqueConstraint(fields=('habit', 'day'), name='habit_completion_day_unique'),
+        ),
+    ]
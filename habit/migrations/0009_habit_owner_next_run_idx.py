@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habit', '0008_habit_completion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(condition=models.Q(('is_pleasure', False)), fields=['owner', 'next_run'], name='habit_owner_next_run_idx'),
+        ),
+    ]
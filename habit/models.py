@@ -4,6 +4,8 @@ from config import settings
 
 NULLABLE = {'null': True, 'blank': True}
 
+MAX_PERIODICITY = 7
+
 
 class Place(models.Model):
     name = models.CharField(max_length=150, verbose_name='место')
@@ -31,9 +33,23 @@ class Action(models.Model):
         ordering = ('pk',)
 
 
+class HabitQuerySet(models.QuerySet):
+
+    def with_related(self):
+        return self.select_related('owner', 'place', 'action', 'pleasure_habit__action')
+
+    def due(self, window_end):
+        return self.select_for_update(skip_locked=True).filter(is_pleasure=False, next_run__lt=window_end).only(
+            'pk', 'owner_id', 'time', 'periodicity', 'next_run').order_by('owner_id', 'next_run')
+
+    def agenda(self, owner_id):
+        return self.filter(owner_id=owner_id, is_pleasure=False, next_run__isnull=False).select_related(
+            'place', 'action', 'pleasure_habit__place', 'pleasure_habit__action').order_by()
+
+
 class Habit(models.Model):
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, **NULLABLE, related_name='habit',
-                              verbose_name='пользователь')
+                              db_index=False, verbose_name='пользователь')
     place = models.ForeignKey(Place, on_delete=models.PROTECT, related_name='habit', verbose_name='место')
     time = models.DateTimeField(auto_now_add=True, verbose_name='время и дата выполнения')
     action = models.ForeignKey(Action, on_delete=models.PROTECT, related_name='habit', verbose_name='действие')
@@ -43,11 +59,63 @@ class Habit(models.Model):
     reward = models.CharField(max_length=150, **NULLABLE, verbose_name='вознаграждение')
     execution_time = models.PositiveSmallIntegerField(default=60, verbose_name='время на выполнение')
     is_public = models.BooleanField(default=False, verbose_name='признак публичности')
+    next_run = models.DateTimeField(**NULLABLE, verbose_name='время следующего напоминания')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='дата изменения')
+    current_streak = models.PositiveIntegerField(default=0, verbose_name='текущая серия')
+    longest_streak = models.PositiveIntegerField(default=0, verbose_name='лучшая серия')
+    completion_count = models.PositiveIntegerField(default=0, verbose_name='количество выполнений')
+    last_completed_on = models.DateField(**NULLABLE, verbose_name='дата последнего выполнения')
+
+    objects = HabitQuerySet.as_manager()
 
     def __str__(self):
-        return self.action
+        return str(self.action)
 
     class Meta:
         verbose_name = 'привычка'
         verbose_name_plural = 'привычки'
         ordering = ('pk',)
+        indexes = [
+            models.Index(fields=['owner', 'id'], name='habit_owner_id_idx'),
+            models.Index(fields=['id'], condition=models.Q(is_public=True), name='habit_public_id_idx'),
+            models.Index(fields=['next_run'], condition=models.Q(is_pleasure=False), name='habit_next_run_idx'),
+            models.Index(fields=['owner', 'updated_at'], name='habit_owner_updated_idx'),
+            models.Index(fields=['owner', 'next_run'], condition=models.Q(is_pleasure=False),
+                         name='habit_owner_next_run_idx'),
+        ]
+
+
+class HabitCompletion(models.Model):
+    habit = models.ForeignKey(Habit, on_delete=models.CASCADE, related_name='completions', db_index=False,
+                              verbose_name='привычка')
+    day = models.DateField(verbose_name='день выполнения')
+    completed_at = models.DateTimeField(auto_now_add=True, verbose_name='время отметки')
+
+    def __str__(self):
+        return f'{self.habit} ({self.day})'
+
+    class Meta:
+        verbose_name = 'выполнение привычки'
+        verbose_name_plural = 'выполнения привычек'
+        ordering = ('pk',)
+        constraints = [
+            models.UniqueConstraint(fields=['habit', 'day'], name='habit_completion_day_unique'),
+        ]
+
+
+class DeadLetter(models.Model):
+    chat_id = models.BigIntegerField(verbose_name='telegram_chat_id')
+    text = models.TextField(verbose_name='текст сообщения')
+    reminders = models.JSONField(default=list, verbose_name='напоминания')
+    status_code = models.PositiveSmallIntegerField(**NULLABLE, verbose_name='код ответа')
+    error = models.TextField(**NULLABLE, verbose_name='ошибка')
+    attempts = models.PositiveSmallIntegerField(default=1, verbose_name='количество попыток')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='дата создания')
+
+    def __str__(self):
+        return f'{self.chat_id}: {self.error}'
+
+    class Meta:
+        verbose_name = 'недоставленное напоминание'
+        verbose_name_plural = 'недоставленные напоминания'
+        ordering = ('pk',)
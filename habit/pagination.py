@@ -1,4 +1,4 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 
 
 class PlacePagination(PageNumberPagination):
@@ -13,7 +13,27 @@ class ActionPagination(PageNumberPagination):
     max_page_size = 30
 
 
-class HabitPagination(PageNumberPagination):
+class HabitPageNumberPagination(PageNumberPagination):
     page_size = 5
     page_size_query_param = 'page_size'
     max_page_size = 30
+
+
+class HabitPagination(CursorPagination):
+    page_size = 5
+    page_size_query_param = 'page_size'
+    max_page_size = 30
+    ordering = 'pk'
+    page_number_pagination_class = HabitPageNumberPagination
+    page_number_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.page_number_pagination_class.page_query_param in request.query_params:
+            self.page_number_paginator = self.page_number_pagination_class()
+            return self.page_number_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.page_number_paginator is not None:
+            return self.page_number_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,31 @@
+from django.conf import settings
+
+from habit.models import Habit
+from habit.services import get_window_end
+
+HOT_QUERIES = {}
+
+
+def hot_query(function):
+    HOT_QUERIES[function.__name__] = function
+    return function
+
+
+@hot_query
+def owner_habits(owner_id):
+    return Habit.objects.filter(owner_id=owner_id).order_by('pk')[:30]
+
+
+@hot_query
+def public_habits(owner_id):
+    return Habit.objects.filter(is_public=True).order_by('pk')[:30]
+
+
+@hot_query
+def due_habits(owner_id):
+    return Habit.objects.due(get_window_end())[:settings.HABIT_DISPATCH_BATCH_SIZE]
+
+
+@hot_query
+def agenda_habits(owner_id):
+    return Habit.objects.agenda(owner_id)
@@ -0,0 +1,63 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from habit.cache import get_version, bump_version
+from habit.models import Place, Action
+
+
+class ReferenceCache:
+    def __init__(self, model):
+        self.model = model
+        self.name = f'reference:{model._meta.label_lower}'
+        self.items = OrderedDict()
+        self.version = None
+        self.checked_at = 0
+        self.lock = threading.Lock()
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def sync(self):
+        now = time.monotonic()
+        if now - self.checked_at < settings.REFERENCE_CACHE_CHECK_INTERVAL:
+            return
+        self.checked_at = now
+        version = get_version(self.name)
+        if version != self.version:
+            self.items.clear()
+            self.version = version
+
+    def get_many(self, ids):
+        with self.lock:
+            self.sync()
+            found = {}
+            for pk in ids:
+                if pk in self.items:
+                    self.items.move_to_end(pk)
+                    found[pk] = self.items[pk]
+        missing = [pk for pk in ids if pk not in found]
+        if missing:
+            loaded = self.model.objects.in_bulk(missing)
+            with self.lock:
+                self.items.update(loaded)
+                while len(self.items) > settings.REFERENCE_CACHE_SIZE:
+                    self.items.popitem(last=False)
+            found.update(loaded)
+        return found
+
+    def get(self, pk):
+        return self.get_many([pk]).get(pk)
+
+    def invalidate(self):
+        bump_version(self.name)
+        with self.lock:
+            self.items.clear()
+            self.version = None
+            self.checked_at = 0
+
+
+places = ReferenceCache(Place)
+actions = ReferenceCache(Action)
@@ -0,0 +1,94 @@
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.functions import ExtractHour, TruncDate
+from django.utils import timezone
+
+from habit.cache import get_version
+from habit.models import Habit, HabitCompletion
+
+
+def get_rates(actual, expected):
+    actual, expected = np.asarray(actual), np.asarray(expected)
+    rates = np.round(np.divide(actual, expected, out=np.zeros(expected.shape), where=expected > 0), 3)
+    return np.where(expected > 0, rates.astype(object), None).tolist()
+
+
+def get_best_hours(heatmap):
+    return np.where(heatmap.sum(axis=-1) > 0, heatmap.argmax(axis=-1).astype(object), None).tolist()
+
+
+def build_adherence_report(user_id, today=None):
+    today = today or timezone.localdate()
+    weeks = settings.HABIT_REPORT_WEEKS
+    start = today - timedelta(days=today.weekday() + 7 * (weeks - 1))
+    days = np.datetime64(start, 'D') + np.arange(weeks * 7)
+
+    habits = list(
+        Habit.objects.filter(owner_id=user_id, is_pleasure=False).order_by('pk')
+        .annotate(anchor=TruncDate('time')).values_list('pk', 'periodicity', 'anchor')
+    )
+    ids, periodicity, anchors = zip(*habits) if habits else ((), (), ())
+    ids = np.array(ids, dtype=np.int64)
+    periodicity = np.maximum(np.array(periodicity, dtype=np.int64), 1)
+    offsets = (days[np.newaxis, :] - np.array(anchors, dtype='datetime64[D]')[:, np.newaxis]).astype(np.int64)
+    expected = (offsets >= 0) & (offsets % periodicity[:, np.newaxis] == 0) & (days <= np.datetime64(today, 'D'))
+
+    completions = list(
+        HabitCompletion.objects.filter(habit__owner_id=user_id, habit__is_pleasure=False, day__gte=start,
+                                       day__lte=today)
+        .annotate(hour=ExtractHour('completed_at')).values_list('habit_id', 'day', 'hour')
+    )
+    habit_ids, completion_days, hours = zip(*completions) if completions else ((), (), ())
+    habit_index = np.searchsorted(ids, np.array(habit_ids, dtype=np.int64))
+    day_index = (np.array(completion_days, dtype='datetime64[D]') - days[0]).astype(np.int64)
+    done = np.zeros(expected.shape, dtype=np.int64)
+    np.add.at(done, (habit_index, day_index), 1)
+    heatmap = np.zeros((len(ids), 24), dtype=np.int64)
+    np.add.at(heatmap, (habit_index, np.array(hours, dtype=np.int64)), 1)
+
+    expected_weekly = expected.reshape(len(ids), weeks, 7).sum(axis=2)
+    credited_weekly = np.minimum(done.reshape(len(ids), weeks, 7).sum(axis=2), expected_weekly)
+    expected_total = expected_weekly.sum(axis=1)
+    credited_total = credited_weekly.sum(axis=1)
+    actual_total = done.sum(axis=1)
+
+    habit_reports = [
+        {
+            'id': habit_id,
+            'expected': expected_count,
+            'actual': actual_count,
+            'rate': rate,
+            'weekly_rate': weekly_rate,
+            'heatmap': habit_heatmap,
+            'best_hour': best_hour,
+        }
+        for habit_id, expected_count, actual_count, rate, weekly_rate, habit_heatmap, best_hour in zip(
+            ids.tolist(), expected_total.tolist(), actual_total.tolist(),
+            get_rates(credited_total, expected_total), get_rates(credited_weekly, expected_weekly),
+            heatmap.tolist(), get_best_hours(heatmap),
+        )
+    ]
+    total_heatmap = heatmap.sum(axis=0)
+    return {
+        'weeks': [str(start + timedelta(weeks=week)) for week in range(weeks)],
+        'expected': int(expected_total.sum()),
+        'actual': int(actual_total.sum()),
+        'rate': get_rates(credited_total.sum(), expected_total.sum()),
+        'weekly_rate': get_rates(credited_weekly.sum(axis=0), expected_weekly.sum(axis=0)),
+        'heatmap': total_heatmap.tolist(),
+        'best_hour': get_best_hours(total_heatmap),
+        'habits': habit_reports,
+    }
+
+
+def get_adherence_report(user_id, today=None):
+    today = today or timezone.localdate()
+    key = f'adherence-report:{user_id}:{get_version(f"completions:{user_id}")}:{today}'
+    report = cache.get(key)
+    if report is None:
+        report = build_adherence_report(user_id, today)
+        cache.set(key, report, settings.HABIT_REPORT_TIMEOUT)
+    return report
@@ -1,7 +1,92 @@
+from datetime import timedelta
+from itertools import islice
+
+from django.utils import timezone
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
-from habit.models import Place, Action, Habit
+from config import settings
+from habit.cache import invalidate_habits, invalidate_reports
+from habit.models import Place, Action, Habit, HabitCompletion
+from habit.reference import places, actions
+from habit.services import assign_schedule, set_schedules, is_schedule_changed
+from habit.validators import RewardValidator, TimeToCompleteValidator, PleasureHabitValidator, \
+    IsPleasureValidator, PeriodicityValidator, patch_validator
+
+
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+
+    def load(self, ids):
+        return self.get_queryset().in_bulk(ids)
+
+    def to_internal_value(self, data):
+        prefetched = self.context.get('prefetched', {}).get(self.field_name)
+        if prefetched is None or isinstance(data, bool):
+            return super().to_internal_value(data)
+        try:
+            instance = prefetched.get(int(data))
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if instance is None:
+            self.fail('does_not_exist', pk_value=data)
+        return instance
+
+
+class ReferencePrimaryKeyRelatedField(PrefetchedPrimaryKeyRelatedField):
+
+    def __init__(self, reference, **kwargs):
+        self.reference = reference
+        super().__init__(**kwargs)
+
+    def load(self, ids):
+        return self.reference.get_many(ids)
+
+    def to_internal_value(self, data):
+        if 'prefetched' in self.context or isinstance(data, bool):
+            return super().to_internal_value(data)
+        try:
+            instance = self.reference.get(int(data))
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if instance is None:
+            self.fail('does_not_exist', pk_value=data)
+        return instance
+
+
+PLAIN_FIELDS = (serializers.IntegerField, serializers.CharField, serializers.BooleanField)
+
+
+def get_value_columns(serializer, model):
+    columns = []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if isinstance(field, serializers.PrimaryKeyRelatedField):
+            columns.append((name, f'{field.source}_id', None))
+        else:
+            source = 'pk' if field.source == model._meta.pk.name else field.source
+            columns.append((name, source, None if isinstance(field, PLAIN_FIELDS) else field.to_representation))
+    return columns
+
+
+def serialize_values(rows, columns):
+    return [
+        {
+            name: row[source] if convert is None or row[source] is None else convert(row[source])
+            for name, source, convert in columns
+        }
+        for row in rows
+    ]
+
+
+def iter_values(queryset, serializer, chunk_size):
+    columns = get_value_columns(serializer, queryset.model)
+    rows = queryset.values(*[source for name, source, convert in columns]).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield from serialize_values(chunk, columns)
 
 
 class PlaceSerializer(serializers.ModelSerializer):
@@ -16,7 +101,165 @@ class ActionSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class HabitListSerializer(serializers.ListSerializer):
+
+    def prefetch(self, data):
+        prefetched = {}
+        for name, field in self.child.fields.items():
+            if not isinstance(field, PrefetchedPrimaryKeyRelatedField) or field.read_only:
+                continue
+            ids = set()
+            for item in data:
+                try:
+                    ids.add(int(item[name]))
+                except (KeyError, TypeError, ValueError):
+                    pass
+            prefetched[name] = field.load(list(ids)) if ids else {}
+        self._context['prefetched'] = prefetched
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list) or not data or not all(isinstance(item, dict) for item in data) \
+                or (self.max_length is not None and len(data) > self.max_length):
+            return super().to_internal_value(data)
+
+        self.prefetch(data)
+        instances = self.instance if isinstance(self.instance, list) else [None] * len(data)
+        validated_data = []
+        errors = []
+        try:
+            for instance, item in zip(instances, data):
+                self.child.instance = instance
+                try:
+                    validated_data.append(self.child.run_validation(item))
+                    errors.append({})
+                except ValidationError as exc:
+                    errors.append(exc.detail)
+        finally:
+            self.child.instance = self.instance
+            del self._context['prefetched']
+        if any(errors):
+            raise ValidationError(errors)
+        return validated_data
+
+    def create(self, validated_data):
+        habits = Habit.objects.bulk_create([Habit(**attrs) for attrs in validated_data])
+        set_schedules(habits)
+        invalidate_habits(habits)
+        return habits
+
+    def update(self, instance, validated_data):
+        fields = {'updated_at'}
+        rescheduled = []
+        now = timezone.now()
+        for habit, attrs in zip(instance, validated_data):
+            schedule_changed = is_schedule_changed(habit, attrs)
+            habit.updated_at = now
+            for field, value in attrs.items():
+                setattr(habit, field, value)
+            fields.update(attrs)
+            if schedule_changed:
+                assign_schedule(habit)
+                fields.add('next_run')
+                rescheduled.append(habit)
+        Habit.objects.bulk_update(instance, fields)
+        invalidate_habits(instance)
+        invalidate_reports(rescheduled)
+        return instance
+
+
 class HabitSerializer(serializers.ModelSerializer):
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
+    place = ReferencePrimaryKeyRelatedField(reference=places, queryset=Place.objects.all(), label='место')
+    action = ReferencePrimaryKeyRelatedField(reference=actions, queryset=Action.objects.all(), label='действие')
+
     class Meta:
         model = Habit
-        fields = '__all__'
+        exclude = ('next_run',)
+        read_only_fields = ('owner', 'current_streak', 'longest_streak', 'completion_count', 'last_completed_on')
+        list_serializer_class = HabitListSerializer
+        validators = [
+            TimeToCompleteValidator('execution_time'),
+            PeriodicityValidator('periodicity'),
+            PleasureHabitValidator('pleasure_habit'),
+            IsPleasureValidator('is_pleasure'),
+        ]
+
+    def validate(self, attrs):
+        if self.instance is not None and self.partial:
+            patch_validator(self.instance, attrs)
+        else:
+            RewardValidator(['reward', 'pleasure_habit'])(attrs)
+        return attrs
+
+
+class HabitIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False,
+                                max_length=settings.HABIT_BULK_MAX_SIZE)
+
+
+class HabitCompletionSerializer(serializers.ModelSerializer):
+    day = serializers.DateField(default=timezone.localdate, label='день выполнения')
+
+    class Meta:
+        model = HabitCompletion
+        fields = ('id', 'habit', 'day', 'completed_at')
+        read_only_fields = ('habit', 'completed_at')
+
+    def validate_day(self, value):
+        if value > timezone.localdate():
+            raise ValidationError('Нельзя отметить выполнение привычки в будущем!')
+        return value
+
+
+class HabitProgressSerializer(serializers.Serializer):
+    current_streak = serializers.IntegerField(read_only=True)
+    longest_streak = serializers.IntegerField(read_only=True)
+    completion_count = serializers.IntegerField(read_only=True)
+    last_completed_on = serializers.DateField(read_only=True)
+
+
+class HabitPairingSerializer(serializers.ModelSerializer):
+    action = serializers.CharField(source='action.name', read_only=True)
+    place = serializers.CharField(source='place.name', read_only=True)
+
+    class Meta:
+        model = Habit
+        fields = ('id', 'action', 'place', 'execution_time')
+
+
+class HabitAgendaSerializer(serializers.ModelSerializer):
+    due_at = serializers.DateTimeField(read_only=True, label='время напоминания')
+    action = serializers.CharField(source='action.name', read_only=True)
+    place = serializers.CharField(source='place.name', read_only=True)
+    pleasure_habit = HabitPairingSerializer(read_only=True)
+
+    class Meta:
+        model = Habit
+        fields = ('id', 'due_at', 'action', 'place', 'execution_time', 'reward', 'pleasure_habit')
+
+
+class HabitAgendaQuerySerializer(serializers.Serializer):
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+
+    def validate(self, attrs):
+        start = attrs.get('start') or timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        end = attrs.get('end') or start + timedelta(days=1)
+        if end <= start:
+            raise ValidationError('Конец периода должен быть позже начала!')
+        if end - start > timedelta(days=settings.HABIT_AGENDA_MAX_DAYS):
+            raise ValidationError(f'Период не может быть длиннее {settings.HABIT_AGENDA_MAX_DAYS} дней!')
+        return {'start': start, 'end': end}
+
+
+class HabitExportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Habit
+        exclude = ('owner', 'next_run')
+
+
+class HabitExportQuerySerializer(serializers.Serializer):
+    file_format = serializers.ChoiceField(choices=('ndjson', 'csv'), default='ndjson')
+    is_public = serializers.BooleanField(required=False)
+    is_pleasure = serializers.BooleanField(required=False)
+    modified_since = serializers.DateTimeField(required=False)
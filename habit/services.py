@@ -1,33 +1,255 @@
+import copy
 import pytz
-import json
-from django_celery_beat.models import PeriodicTask, IntervalSchedule
+import random
+import time
+from datetime import datetime, timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
 
 from config import settings
+from habit.cache import bump_version, invalidate_reports
+from habit.metrics import timer, observe, count
+from habit.models import Habit, HabitCompletion, DeadLetter
+from habit.reference import places, actions
+
+
+SCHEDULE_FIELDS = ('time', 'periodicity', 'is_pleasure')
+
+
+def is_schedule_changed(habit, validated_data):
+    return any(
+        field in validated_data and validated_data[field] != getattr(habit, field) for field in SCHEDULE_FIELDS
+    )
+
+
+def get_next_run(habit, after=None):
+    if after is None:
+        after = timezone.now()
+    period = timedelta(days=max(habit.periodicity, 1))
+    return habit.time + period * max(-((habit.time - after) // period), 0)
+
+
+def get_agenda(habits, start, end):
+    occurrences = []
+    for habit in habits:
+        period = timedelta(days=max(habit.periodicity, 1))
+        due_at = get_next_run(habit, after=start)
+        while due_at < end:
+            occurrence = copy.copy(habit)
+            occurrence.due_at = due_at
+            occurrences.append(occurrence)
+            due_at += period
+    return sorted(occurrences, key=lambda occurrence: (occurrence.due_at, occurrence.pk))
+
+
+def assign_schedule(habit, now=None):
+    habit.next_run = None if habit.is_pleasure else get_next_run(habit, after=now)
 
 
 def set_schedule(habit):
-    if not habit.is_pleasure:
+    with timer('habit_schedule_update_seconds'):
+        assign_schedule(habit)
+        Habit.objects.filter(pk=habit.pk).update(next_run=habit.next_run)
+
+
+def set_schedules(habits):
+    now = timezone.now()
+    for habit in habits:
+        assign_schedule(habit, now=now)
+    Habit.objects.bulk_update(habits, ['next_run'])
+    invalidate_reports(habits)
+
+
+def is_streak_alive(habit, day):
+    return habit.last_completed_on is not None and (day - habit.last_completed_on).days <= max(habit.periodicity, 1)
+
+
+def complete_habit(habit_pk, day):
+    with transaction.atomic():
+        habit = Habit.objects.select_for_update().only(
+            'pk', 'owner_id', 'is_public', 'periodicity', 'current_streak', 'longest_streak', 'completion_count',
+            'last_completed_on',
+        ).get(pk=habit_pk)
+        if habit.last_completed_on is not None and day <= habit.last_completed_on:
+            return None
+        completion = HabitCompletion.objects.create(habit=habit, day=day)
+        habit.current_streak = habit.current_streak + 1 if is_streak_alive(habit, day) else 1
+        habit.longest_streak = max(habit.longest_streak, habit.current_streak)
+        habit.completion_count += 1
+        habit.last_completed_on = day
+        habit.save(update_fields=['current_streak', 'longest_streak', 'completion_count', 'last_completed_on',
+                                  'updated_at'])
+    bump_version(f'completions:{habit.owner_id}')
+    return completion
+
+
+def get_progress(habit, today=None):
+    return {
+        'current_streak': habit.current_streak if is_streak_alive(habit, today or timezone.localdate()) else 0,
+        'longest_streak': habit.longest_streak,
+        'completion_count': habit.completion_count,
+        'last_completed_on': habit.last_completed_on,
+    }
+
+
+def get_window_end(now=None):
+    if now is None:
+        now = timezone.now()
+    return now.replace(second=0, microsecond=0) + timedelta(minutes=settings.HABIT_DIGEST_WINDOW)
+
+
+def collect_due_habits(now=None):
+    window_end = get_window_end(now)
+    while True:
+        with transaction.atomic():
+            habits = list(Habit.objects.due(window_end)[:settings.HABIT_DISPATCH_BATCH_SIZE])
+            if not habits:
+                return
+            for habit in habits:
+                habit.due_at = habit.next_run
+                habit.next_run = get_next_run(habit, after=window_end)
+            Habit.objects.bulk_update(habits, ['next_run'])
+        yield habits
+
+
+def reconcile_schedules(batch_size=None):
+    batch_size = batch_size or settings.HABIT_RECONCILE_BATCH_SIZE
+    started = time.monotonic()
+    now = timezone.now()
+
+    counts = {
+        'orphaned': Habit.objects.filter(is_pleasure=True, next_run__isnull=False).update(next_run=None),
+    }
+
+    stale = Q(next_run__lt=now - timedelta(minutes=settings.HABIT_RECONCILE_GRACE))
+    for periodicity in Habit.objects.order_by().values_list('periodicity', flat=True).distinct():
+        stale |= Q(periodicity=periodicity, next_run__gt=now + timedelta(days=max(periodicity, 1)))
+
+    for name, condition in (('missing', Q(next_run__isnull=True)), ('stale', stale)):
+        counts[name] = 0
+        queryset = Habit.objects.filter(condition, is_pleasure=False).only(
+            'pk', 'owner_id', 'time', 'periodicity').order_by()
+        habits = []
+        for habit in queryset.iterator(chunk_size=batch_size):
+            habit.next_run = get_next_run(habit, after=now)
+            habits.append(habit)
+            if len(habits) >= batch_size:
+                Habit.objects.bulk_update(habits, ['next_run'])
+                counts[name] += len(habits)
+                habits = []
+        Habit.objects.bulk_update(habits, ['next_run'])
+        counts[name] += len(habits)
+
+    counts['seconds'] = round(time.monotonic() - started, 3)
+    return counts
+
+
+def resolve_reminders(habit_ids):
+    keys = {habit_id: f'reminder:{habit_id}' for habit_id in habit_ids}
+    cached = cache.get_many(keys.values())
+    missing = [habit_id for habit_id in habit_ids if keys[habit_id] not in cached]
+    if missing:
         target_timezone = pytz.timezone(settings.TIME_ZONE)
-        converted_datetime = habit.time.astimezone(target_timezone)
+        resolved = {}
+        for row in Habit.objects.filter(pk__in=missing).values(
+                'pk', 'time', 'owner__telegram_chat_id', 'action_id', 'place_id'):
+            resolved[keys[row['pk']]] = {
+                'chat_id': row['owner__telegram_chat_id'],
+                'action_id': row['action_id'],
+                'time': str(row['time'].astimezone(target_timezone).time().replace(second=0, microsecond=0)),
+                'place_id': row['place_id'],
+            }
+        cache.set_many(resolved, settings.HABIT_REMINDER_CACHE_TTL)
+        cached.update(resolved)
 
-        schedule, created = IntervalSchedule.objects.get_or_create(
-            every=habit.periodicity,
-            period=IntervalSchedule.MINUTES,
-        )
-        PeriodicTask.objects.create(
-            interval=schedule,
-            name=str(habit.pk),
-            task='habits.tasks.send_telegram_message',
-            kwargs=json.dumps({
-                'chat_id': habit.owner.telegram_chat_id,
-                'action': habit.action.name,
-                'time': str(converted_datetime.time().replace(second=0, microsecond=0)),
-                'place': habit.place.name
-            })
+    found = [cached[keys[habit_id]] for habit_id in habit_ids if keys[habit_id] in cached]
+    action_names = actions.get_many(list({reminder['action_id'] for reminder in found}))
+    place_names = places.get_many(list({reminder['place_id'] for reminder in found}))
+    return {
+        habit_id: {
+            'chat_id': cached[keys[habit_id]]['chat_id'],
+            'action': action_names[cached[keys[habit_id]]['action_id']].name,
+            'time': cached[keys[habit_id]]['time'],
+            'place': place_names[cached[keys[habit_id]]['place_id']].name,
+        }
+        for habit_id in habit_ids if keys[habit_id] in cached
+    }
+
+
+def render_reminder(reminder):
+    return f"Я буду {reminder['action']} в {reminder['time']} в {reminder['place']}"
+
+
+def render_digest(reminders):
+    if len(reminders) == 1:
+        return render_reminder(reminders[0])
+    return 'Напоминания:\n' + '\n'.join(f'- {render_reminder(reminder)}' for reminder in reminders)
+
+
+def build_messages(reminders):
+    claimed = []
+    for habit_id, due_at in reminders:
+        key = f'reminder-sent:{habit_id}:{due_at}'
+        if cache.add(key, True, settings.HABIT_IDEMPOTENCY_TTL):
+            claimed.append((habit_id, due_at, key))
+
+    resolved = resolve_reminders([habit_id for habit_id, due_at, key in claimed])
+    digests = {}
+    for habit_id, due_at, key in claimed:
+        reminder = resolved.get(habit_id)
+        if reminder is None or reminder['chat_id'] is None:
+            continue
+        digest = digests.setdefault(reminder['chat_id'], {'lines': [], 'reminders': [], 'keys': []})
+        digest['lines'].append(reminder)
+        digest['reminders'].append((habit_id, due_at))
+        digest['keys'].append(key)
+
+    return [
+        {
+            'chat_id': chat_id,
+            'text': render_digest(digest['lines']),
+            'reminders': digest['reminders'],
+            'keys': digest['keys'],
+        }
+        for chat_id, digest in digests.items()
+    ]
+
+
+def release_messages(messages):
+    cache.delete_many([key for message in messages for key in message['keys']])
+
+
+def get_retry_countdown(retries, results):
+    backoff = min(settings.TELEGRAM_RETRY_BACKOFF_MAX, settings.TELEGRAM_RETRY_BACKOFF * 2 ** retries)
+    return max([random.uniform(backoff / 2, backoff)] + [result.retry_after for result in results if result.retry_after])
+
+
+def store_dead_letters(failures, attempts):
+    DeadLetter.objects.bulk_create([
+        DeadLetter(
+            chat_id=message['chat_id'],
+            text=message['text'],
+            reminders=message['reminders'],
+            status_code=result.status_code,
+            error=result.error,
+            attempts=attempts,
         )
+        for message, result in failures
+    ])
 
 
-def delete_schedule(habit_pk):
-    if PeriodicTask.objects.filter(name=str(habit_pk)).exists():
-        periodic_task = PeriodicTask.objects.get(name=str(habit_pk))
-        periodic_task.delete()
+def record_delivery(messages, results, dispatched_at=None, started_at=None):
+    now = timezone.now()
+    sent = [message for message, result in zip(messages, results) if result.ok]
+    if dispatched_at is not None and started_at is not None:
+        observe('habit_reminder_queue_wait_seconds', [max(started_at - dispatched_at, 0)])
+    observe('habit_reminder_lag_seconds', [
+        max((now - datetime.fromisoformat(due_at)).total_seconds(), 0)
+        for message in sent for habit_id, due_at in message['reminders']
+    ])
+    count('habit_reminders_sent', sum(len(message['reminders']) for message in sent))
+    count('habit_reminders_failed', sum(len(message['reminders']) for message in messages) - sum(
+        len(message['reminders']) for message in sent))
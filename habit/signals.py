@@ -0,0 +1,35 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from habit.cache import invalidate_habits, forget_habits, invalidate_reports
+from habit.models import Place, Action, Habit
+from habit.reference import places, actions
+
+
+@receiver(post_save, sender=Habit)
+def invalidate_habit(sender, instance, **kwargs):
+    invalidate_habits([instance])
+
+
+@receiver(post_delete, sender=Habit)
+def forget_habit(sender, instance, **kwargs):
+    forget_habits([instance])
+
+
+@receiver(post_save, sender=Habit)
+@receiver(post_delete, sender=Habit)
+def invalidate_habit_report(sender, instance, **kwargs):
+    invalidate_reports([instance])
+
+
+@receiver(post_save, sender=Place)
+@receiver(post_delete, sender=Place)
+def invalidate_places(sender, instance, **kwargs):
+    transaction.on_commit(places.invalidate)
+
+
+@receiver(post_save, sender=Action)
+@receiver(post_delete, sender=Action)
+def invalidate_actions(sender, instance, **kwargs):
+    transaction.on_commit(actions.invalidate)
@@ -1,10 +1,115 @@
+import time
+from itertools import islice
+
 from celery import shared_task
-import requests
-from config import settings
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from habit.models import Habit, DeadLetter
+from habit.reports import get_adherence_report
+from habit.services import collect_due_habits, build_messages, release_messages, \
+    reconcile_schedules as reconcile, set_schedule, get_retry_countdown, store_dead_letters, record_delivery
+from habit.telegram import get_sender
+
+
+@shared_task
+def send_telegram_messages(messages):
+    return [result.status_code for result in get_sender().send_many(messages)]
+
+
+@shared_task(bind=True)
+def send_habit_reminders(self, reminders, dispatched_at=None):
+    started_at = time.time()
+    messages = build_messages(reminders)
+    results = get_sender().send_many(messages)
+    record_delivery(messages, results, dispatched_at, started_at)
+    failures = [(message, result) for message, result in zip(messages, results) if not result.ok]
+    release_messages([message for message, result in failures])
+
+    can_retry = self.request.retries < settings.TELEGRAM_MAX_RETRIES
+    retryable = [(message, result) for message, result in failures if can_retry and result.retryable]
+    store_dead_letters(
+        [(message, result) for message, result in failures if not (can_retry and result.retryable)],
+        attempts=self.request.retries + 1,
+    )
+    if retryable:
+        raise self.retry(
+            args=([reminder for message, result in retryable for reminder in message['reminders']],),
+            kwargs={},
+            countdown=get_retry_countdown(self.request.retries, [result for message, result in retryable]),
+            max_retries=settings.TELEGRAM_MAX_RETRIES,
+        )
+    return [result.status_code for result in results]
+
+
+@shared_task
+def dispatch_due_habits():
+    dispatched = 0
+    reminders = []
+    owner_id = None
+    for habits in collect_due_habits():
+        for habit in habits:
+            if habit.owner_id != owner_id and len(reminders) >= settings.TELEGRAM_BATCH_SIZE:
+                send_habit_reminders.delay(reminders, dispatched_at=time.time())
+                dispatched += len(reminders)
+                reminders = []
+            owner_id = habit.owner_id
+            reminders.append((habit.pk, habit.due_at.isoformat()))
+    if reminders:
+        send_habit_reminders.delay(reminders, dispatched_at=time.time())
+        dispatched += len(reminders)
+    return dispatched
+
+
+@shared_task
+def reconcile_schedules():
+    return reconcile()
+
+
+@shared_task
+def reschedule_habit(habit_pk):
+    cache.delete(f'reschedule:{habit_pk}')
+    habit = Habit.objects.filter(pk=habit_pk).only('pk', 'owner_id', 'time', 'periodicity', 'is_pleasure').first()
+    if habit is not None:
+        set_schedule(habit)
+
+
+@shared_task
+def build_adherence_reports(user_ids):
+    for user_id in user_ids:
+        get_adherence_report(user_id)
+    return len(user_ids)
 
 
 @shared_task
-def send_telegram_message(**kwargs):
-    params = {'chat_id': kwargs['chat_id'], 'text': f"Я буду {kwargs['action']} в {kwargs['time']} в {kwargs['place']}"}
-    message = requests.post(f'https://api.telegram.org/bot{settings.BOT_API_TOKEN}/sendMessage', params=params)
-    print(message.status_code)
+def precompute_adherence_reports():
+    user_ids = Habit.objects.filter(owner__isnull=False, is_pleasure=False).order_by('owner_id').values_list(
+        'owner_id', flat=True).distinct().iterator(chunk_size=settings.HABIT_REPORT_BATCH_SIZE)
+    batches = 0
+    while True:
+        batch = list(islice(user_ids, settings.HABIT_REPORT_BATCH_SIZE))
+        if not batch:
+            return batches
+        build_adherence_reports.delay(batch)
+        batches += 1
+
+
+def request_reschedule(habit_pk):
+    delay = settings.HABIT_RESCHEDULE_DELAY
+    if cache.add(f'reschedule:{habit_pk}', True, delay + 60):
+        transaction.on_commit(lambda: reschedule_habit.apply_async((habit_pk,), countdown=delay))
+
+
+def replay_dead_letters(queryset):
+    replayed = 0
+    last_pk = 0
+    while True:
+        letters = list(queryset.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'reminders')
+                       [:settings.TELEGRAM_BATCH_SIZE])
+        if not letters:
+            return replayed
+        last_pk = letters[-1][0]
+        send_habit_reminders.delay([reminder for pk, reminders in letters for reminder in reminders])
+        DeadLetter.objects.filter(pk__in=[pk for pk, reminders in letters]).delete()
+        replayed += len(letters)
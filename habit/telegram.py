@@ -0,0 +1,200 @@
+import threading
+import time
+from dataclasses import dataclass
+
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+
+from habit.metrics import observe
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated_at = clock()
+        self.lock = threading.Lock()
+
+    def consume(self):
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def is_full(self):
+        with self.lock:
+            return self.tokens + (self.clock() - self.updated_at) * self.rate >= self.capacity
+
+    def acquire(self):
+        delay = self.consume()
+        while delay:
+            time.sleep(delay)
+            delay = self.consume()
+
+
+class RequestsTransport:
+    def __init__(self, timeout, pool_size):
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def post(self, url, data):
+        response = self.session.post(url, data=data, timeout=self.timeout)
+        try:
+            return response.status_code, response.json()
+        except ValueError:
+            return response.status_code, {}
+
+
+@dataclass
+class DeliveryResult:
+    chat_id: int
+    status_code: int = None
+    error: str = None
+    retry_after: float = None
+
+    @property
+    def ok(self):
+        return self.status_code == 200
+
+    @property
+    def retryable(self):
+        return self.status_code is None or self.status_code == 429 or self.status_code >= 500
+
+
+def make_result(chat_id, status_code, payload):
+    if status_code == 200:
+        return DeliveryResult(chat_id, status_code)
+    return DeliveryResult(
+        chat_id,
+        status_code,
+        error=payload.get('description'),
+        retry_after=payload.get('parameters', {}).get('retry_after'),
+    )
+
+
+class CircuitBreaker:
+    def __init__(self, threshold, reset_timeout, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def remaining(self):
+        with self.lock:
+            if self.opened_at is None:
+                return 0
+            remaining = self.opened_at + self.reset_timeout - self.clock()
+            if remaining <= 0:
+                self.opened_at = self.clock()
+                return 0
+            return remaining
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = self.clock()
+
+    def record(self, result):
+        if result.status_code is None or result.status_code >= 500:
+            self.record_failure()
+        elif result.status_code != 429:
+            self.record_success()
+
+
+class TelegramSender:
+    max_chat_buckets = 10000
+
+    def __init__(self, transport, api_url, token, global_rate, chat_rate, breaker=None):
+        self.transport = transport
+        self.url = f'{api_url}/bot{token}/sendMessage'
+        self.chat_rate = chat_rate
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_buckets = {}
+        self.breaker = breaker or CircuitBreaker(threshold=5, reset_timeout=30)
+        self.lock = threading.Lock()
+
+    def get_chat_bucket(self, chat_id):
+        with self.lock:
+            if len(self.chat_buckets) >= self.max_chat_buckets:
+                self.chat_buckets = {key: bucket for key, bucket in self.chat_buckets.items() if not bucket.is_full()}
+            if chat_id not in self.chat_buckets:
+                self.chat_buckets[chat_id] = TokenBucket(self.chat_rate)
+            return self.chat_buckets[chat_id]
+
+    def send(self, chat_id, text, durations):
+        remaining = self.breaker.remaining()
+        if remaining:
+            return DeliveryResult(chat_id, error='Telegram API недоступен', retry_after=remaining)
+        self.get_chat_bucket(chat_id).acquire()
+        self.global_bucket.acquire()
+        started = time.monotonic()
+        try:
+            status_code, payload = self.transport.post(self.url, {'chat_id': chat_id, 'text': text})
+        except requests.RequestException as error:
+            result = DeliveryResult(chat_id, error=repr(error))
+        else:
+            durations.append(time.monotonic() - started)
+            result = make_result(chat_id, status_code, payload)
+        self.breaker.record(result)
+        return result
+
+    def send_many(self, messages):
+        durations = []
+        results = [self.send(message['chat_id'], message['text'], durations) for message in messages]
+        observe('habit_telegram_send_seconds', durations)
+        return results
+
+
+def get_breaker():
+    return CircuitBreaker(
+        threshold=settings.TELEGRAM_BREAKER_THRESHOLD,
+        reset_timeout=settings.TELEGRAM_BREAKER_RESET_TIMEOUT,
+    )
+
+
+_sender = None
+_sender_lock = threading.Lock()
+
+
+def get_sender():
+    global _sender
+    with _sender_lock:
+        if _sender is None:
+            transport_class = import_string(settings.TELEGRAM_TRANSPORT)
+            _sender = TelegramSender(
+                transport=transport_class(timeout=settings.TELEGRAM_TIMEOUT, pool_size=settings.TELEGRAM_POOL_SIZE),
+                api_url=settings.TELEGRAM_API_URL,
+                token=settings.BOT_API_TOKEN,
+                global_rate=settings.TELEGRAM_GLOBAL_RATE,
+                chat_rate=settings.TELEGRAM_CHAT_RATE,
+                breaker=get_breaker(),
+            )
+        return _sender
+
+
+@receiver(setting_changed)
+def reset_sender(setting, **kwargs):
+    global _sender
+    if setting.startswith('TELEGRAM_') or setting == 'BOT_API_TOKEN':
+        _sender = None
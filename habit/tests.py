@@ -1,20 +1,189 @@
+import asyncio
+import json
 import pytz
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
 
-from django_celery_beat.models import PeriodicTask
-from rest_framework import status
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from celery.exceptions import Retry
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework import serializers, status
 from rest_framework.test import APITestCase
 from rest_framework_simplejwt.tokens import AccessToken
 
 from config import settings
-from habit.models import Place, Action, Habit
-from habit.services import set_schedule, delete_schedule
-from habit.tasks import send_telegram_message
+from habit import renderers
+from habit.cache import bump_version, get_version
+from habit.delivery import AsyncDeliveryEngine
+from habit.metrics import get_histogram, get_bucket
+from habit.reference import places
+from habit.models import Place, Action, Habit, HabitCompletion, DeadLetter
+from habit.queries import HOT_QUERIES
+from habit.services import set_schedule, collect_due_habits, resolve_reminders, \
+    reconcile_schedules
+from habit.tasks import send_telegram_messages, send_habit_reminders, reschedule_habit, replay_dead_letters, \
+    build_adherence_reports, precompute_adherence_reports
+from habit.serializers import HabitSerializer
+from habit.views import HabitListAPIView, HabitPublicListAPIView, HabitRetrieveAPIView, HabitAgendaAPIView
+from habit.telegram import TokenBucket, TelegramSender, RequestsTransport, CircuitBreaker
 from users.models import User
 
 
-class HabitTestCase(APITestCase):
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+class TelegramStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length'])).decode()
+        self.server.received.append((self.path, self.client_address, parse_qs(body)))
+        status_code, payload = self.server.responses.pop(0) if self.server.responses else (200, {'ok': True})
+        response = payload.encode() if isinstance(payload, str) else json.dumps(payload).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'text/html' if isinstance(payload, str) else 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TelegramStubServer:
+    def __init__(self, responses=None):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), TelegramStubHandler)
+        self.server.received = []
+        self.server.responses = list(responses or [])
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    @property
+    def received(self):
+        return self.server.received
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TelegramSenderTestCase(SimpleTestCase):
+
+    def test_token_bucket(self):
+        now = [0]
+        bucket = TokenBucket(rate=2, clock=lambda: now[0])
+        self.assertEqual(bucket.consume(), 0)
+        self.assertEqual(bucket.consume(), 0)
+        self.assertEqual(bucket.consume(), 0.5)
+        now[0] = 0.5
+        self.assertEqual(bucket.consume(), 0)
+
+    def test_send_many_reuses_connection(self):
+        with TelegramStubServer() as stub:
+            sender = TelegramSender(RequestsTransport(timeout=5, pool_size=1), stub.url, 'token', 100, 100)
+            with mock.patch('habit.telegram.observe') as observe:
+                results = sender.send_many([{'chat_id': 1, 'text': 'a'}, {'chat_id': 2, 'text': 'b'}])
+        observe.assert_called_once()
+        self.assertEqual(len(observe.call_args[0][1]), 2)
+        self.assertEqual([result.status_code for result in results], [200, 200])
+        self.assertEqual([request[0] for request in stub.received], ['/bottoken/sendMessage'] * 2)
+        self.assertEqual([request[2]['text'] for request in stub.received], [['a'], ['b']])
+        self.assertEqual(len({request[1] for request in stub.received}), 1)
+
+    def test_send_telegram_messages(self):
+        with TelegramStubServer() as stub, override_settings(TELEGRAM_API_URL=stub.url, BOT_API_TOKEN='token'):
+            result = send_telegram_messages([{'chat_id': 1, 'text': 'a'}])
+        self.assertEqual(result, [200])
+        self.assertEqual(stub.received[0][2], {'chat_id': ['1'], 'text': ['a']})
+
+    def test_send_results(self):
+        responses = [
+            (429, {'ok': False, 'parameters': {'retry_after': 3}}),
+            (403, {'ok': False, 'description': 'Forbidden'}),
+            (502, {'ok': False}),
+        ]
+        with TelegramStubServer(responses=responses) as stub:
+            breaker = CircuitBreaker(threshold=1, reset_timeout=60)
+            sender = TelegramSender(RequestsTransport(timeout=5, pool_size=1), stub.url, 'token', 100, 100, breaker)
+            results = sender.send_many([{'chat_id': chat_id, 'text': 'a'} for chat_id in range(4)])
+        self.assertEqual([result.status_code for result in results], [429, 403, 502, None])
+        self.assertEqual([result.retryable for result in results], [True, False, True, True])
+        self.assertEqual(results[0].retry_after, 3)
+        self.assertEqual(len(stub.received), 3)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AsyncDeliveryEngineTestCase(SimpleTestCase):
+
+    async def deliver(self, engine, messages):
+        results = await engine.deliver(messages)
+        await engine.close()
+        return results
+
+    def test_deliver(self):
+        messages = [{'chat_id': chat_id, 'text': f'text {chat_id}'} for chat_id in range(5)]
+        with TelegramStubServer(responses=[(500, {'ok': False, 'description': 'error'})]) as stub:
+            engine = AsyncDeliveryEngine(stub.url, 'token', concurrency=2, timeout=5, global_rate=100, chat_rate=100)
+            results = asyncio.run(self.deliver(engine, messages))
+        self.assertEqual(len(stub.received), 5)
+        self.assertLessEqual(len({request[1] for request in stub.received}), 2)
+        self.assertEqual(sorted(result.status_code for result in results), [200, 200, 200, 200, 500])
+        self.assertEqual([result.chat_id for result in results], list(range(5)))
+
+    def test_deliver_non_json_error(self):
+        with TelegramStubServer(responses=[(502, '<html>Bad Gateway</html>')]) as stub:
+            engine = AsyncDeliveryEngine(stub.url, 'token', concurrency=1, timeout=5, global_rate=100, chat_rate=100)
+            results = asyncio.run(self.deliver(engine, [{'chat_id': 1, 'text': 'a'}, {'chat_id': 2, 'text': 'b'}]))
+        self.assertEqual([result.status_code for result in results], [502, 200])
+        self.assertTrue(results[0].retryable)
+        self.assertEqual(len(stub.received), 2)
+
+    def test_deliver_connection_error(self):
+        with TelegramStubServer() as stub:
+            url = stub.url
+        engine = AsyncDeliveryEngine(url, 'token', concurrency=1, timeout=5, global_rate=100, chat_rate=100,
+                                     breaker=CircuitBreaker(threshold=1, reset_timeout=60))
+        results = asyncio.run(self.deliver(engine, [{'chat_id': 1, 'text': 'text'}, {'chat_id': 2, 'text': 'text'}]))
+        self.assertEqual([result.status_code for result in results], [None, None])
+        self.assertTrue(all(result.retryable for result in results))
+        self.assertEqual(results[1].error, 'Telegram API недоступен')
+        self.assertGreater(results[1].retry_after, 0)
+
+
+class QueryBudgetMixin:
+
+    def assertQueryBudget(self, view, path):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        queries = '\n'.join(query['sql'] for query in context.captured_queries)
+        self.assertLessEqual(len(context), view.query_budget, f'{path}:\n{queries}')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class HabitTestCase(QueryBudgetMixin, APITestCase):
 
     def setUp(self) -> None:
+        cache.clear()
         self.user = User.objects.create(
             email='test@test.ru',
             telegram_chat_id=settings.SUPERUSER_TELEGRAM_CHAT_ID,
@@ -27,13 +196,14 @@ class HabitTestCase(APITestCase):
         self.access_token = str(AccessToken.for_user(self.user))
         self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
 
-        self.place = Place.objects.create(
-            name='test_place',
-        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.place = Place.objects.create(
+                name='test_place',
+            )
 
-        self.action = Action.objects.create(
-            name='test_action',
-        )
+            self.action = Action.objects.create(
+                name='test_action',
+            )
 
         self.useful_habit = Habit.objects.create(
             owner=self.user,
@@ -129,7 +299,7 @@ class HabitTestCase(APITestCase):
         response = self.client.post('/habit/create/', habit)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertTrue(Habit.objects.filter(id=response.json().get('id')).exists())
-        self.assertTrue(PeriodicTask.objects.filter(name=response.json().get('id')).exists())
+        self.assertIsNotNone(Habit.objects.get(id=response.json().get('id')).next_run)
 
     def test_list_habit(self):
         response = self.client.get('/habit/')
@@ -140,6 +310,241 @@ class HabitTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.json()['id'], self.useful_habit.pk)
 
+    def test_conditional_get(self):
+        for url in ('/habit/', f'/habit/{self.useful_habit.pk}/', '/places/'):
+            etag = self.client.get(url)['ETag']
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response['ETag'], etag)
+
+        last_modified = self.client.get('/habit/')['Last-Modified']
+        response = self.client.get('/habit/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        etag = self.client.get('/habit/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/habit/{self.useful_habit.pk}/update/', {'reward': 'new_reward'})
+        self.assertEqual(self.client.get('/habit/', HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+        etag = self.client.get('/habit/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch('/habit/bulk/update/', [{'id': self.useful_habit.pk, 'reward': 'bulk_reward'}],
+                              format='json')
+        self.assertEqual(self.client.get('/habit/', HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+        etag = self.client.get('/places/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Place.objects.create(name='new_place')
+        self.assertEqual(self.client.get('/places/', HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+        last_modified = self.client.get('/habit/')['Last-Modified']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/habit/{self.useful_habit.pk}/update/', {'reward': 'same_second'})
+        response = self.client.get('/habit/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_conditional_get_requires_access(self):
+        future = http_date(time.time() + 3600)
+        self.client.get(f'/habit/{self.useful_habit.pk}/')
+        other_user = User.objects.create(email='other@test.ru', telegram_chat_id='1')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(other_user)}')
+        for url in (f'/habit/{self.useful_habit.pk}/', '/habit/0/'):
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=future)
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertIsNone(cache.get(f'version:habit:{other_user.pk}:0'))
+
+    def test_versions_bump_after_commit(self):
+        self.client.get('/habit/')
+        version = get_version(f'habits:{self.user.pk}')
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.delete('/habit/bulk/delete/', {'ids': [self.useful_habit.pk]}, format='json')
+            self.assertEqual(get_version(f'habits:{self.user.pk}'), version)
+        for callback in callbacks:
+            callback()
+        self.assertGreater(get_version(f'habits:{self.user.pk}'), version)
+
+    def test_public_feed_ignores_schedule(self):
+        Habit.objects.filter(pk=self.useful_habit.pk).update(is_public=True)
+        set_schedule(Habit.objects.get(pk=self.useful_habit.pk))
+        response = self.client.get('/habit/public/')
+        self.assertNotIn('next_run', response.json()['results'][0])
+        with self.captureOnCommitCallbacks(execute=True):
+            list(collect_due_habits(now=timezone.now() + timedelta(days=1)))
+        self.assertEqual(self.client.get('/habit/public/', HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+
+    def test_fast_serialization_parity(self):
+        Place.objects.create(name='Парк \u2028 "у реки"', description=None)
+        Habit.objects.filter(pk=self.useful_habit.pk).update(is_public=True, reward=None)
+        set_schedule(self.useful_habit)
+        urls = ('/habit/', '/habit/?page=1', '/habit/?page_size=1', '/habit/public/', '/places/', '/actions/',
+                '/places/?page_size=30')
+        expected = {url: self.client.get(url).content for url in urls}
+        cache.clear()
+        with mock.patch.object(settings, 'HABIT_FAST_SERIALIZATION', True):
+            for encoder in (renderers.orjson, None):
+                with mock.patch.object(renderers, 'orjson', encoder):
+                    for url in urls:
+                        cache.clear()
+                        response = self.client.get(url)
+                        self.assertIsInstance(response.accepted_renderer, renderers.FastJSONRenderer)
+                        self.assertEqual(response.content, expected[url], url)
+            self.assertQueryBudget(HabitListAPIView, '/habit/')
+
+    def test_agenda(self):
+        now = timezone.now()
+        paired_habit = Habit.objects.create(owner=self.user, place=self.place, action=self.action,
+                                            pleasure_habit=self.pleasure_habit, periodicity=2)
+        Habit.objects.filter(pk=paired_habit.pk).update(time=now - timedelta(hours=2),
+                                                        next_run=now + timedelta(hours=46))
+        Habit.objects.filter(pk=self.useful_habit.pk).update(time=now - timedelta(hours=47),
+                                                             next_run=now + timedelta(hours=1))
+        other_user = User.objects.create(email='other@test.ru')
+        Habit.objects.create(owner=other_user, place=self.place, action=self.action, next_run=now)
+
+        start = (now - timedelta(hours=30)).isoformat()
+        end = (now + timedelta(hours=30)).isoformat()
+        response = self.client.get('/habit/agenda/', {'start': start, 'end': end})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([habit['id'] for habit in response.json()],
+                         [self.useful_habit.pk, paired_habit.pk, self.useful_habit.pk, self.useful_habit.pk])
+        self.assertEqual([habit['due_at'] for habit in response.json()], [
+            serializers.DateTimeField().to_representation(now + timedelta(hours=hours)) for hours in (-23, -2, 1, 25)
+        ])
+        self.assertEqual(response.json()[1]['action'], self.action.name)
+        self.assertEqual(response.json()[1]['pleasure_habit'], {
+            'id': self.pleasure_habit.pk,
+            'action': self.action.name,
+            'place': self.place.name,
+            'execution_time': self.pleasure_habit.execution_time,
+        })
+        self.assertQueryBudget(HabitAgendaAPIView, f'/habit/agenda/?start={start[:19]}&end={end[:19]}')
+
+        old_habit = Habit.objects.create(owner=self.user, place=self.place, action=self.action, reward='yes')
+        Habit.objects.filter(pk=old_habit.pk).update(time=now - timedelta(days=60), next_run=now + timedelta(days=1))
+        for days in (3, 10, 30):
+            response = self.client.get('/habit/agenda/', {
+                'start': (now - timedelta(days=days, hours=12)).isoformat(),
+                'end': (now - timedelta(days=days - 1, hours=12)).isoformat(),
+            })
+            self.assertEqual([habit['id'] for habit in response.json()], [old_habit.pk])
+
+        response = self.client.get('/habit/agenda/', {'end': start, 'start': end})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get('/habit/agenda/').status_code, status.HTTP_200_OK)
+
+    def test_complete_habit(self):
+        today = timezone.localdate()
+        url = f'/habit/{self.useful_habit.pk}/complete/'
+        for day, streak in ((today - timedelta(days=3), 1), (today - timedelta(days=2), 2), (today, 1)):
+            response = self.client.post(url, {'day': day})
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(response.json()['day'], str(day))
+            self.useful_habit.refresh_from_db()
+            self.assertEqual(self.useful_habit.current_streak, streak)
+
+        self.assertEqual(self.client.post(url).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.post(url, {'day': today + timedelta(days=1)}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.useful_habit.completions.count(), 3)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/habit/{self.useful_habit.pk}/progress/')
+        self.assertEqual(response.json(), {
+            'current_streak': 1,
+            'longest_streak': 2,
+            'completion_count': 3,
+            'last_completed_on': str(today),
+        })
+        self.client.patch(f'/habit/{self.useful_habit.pk}/update/', {'reward': 'new_reward'})
+        self.useful_habit.refresh_from_db()
+        self.assertEqual(self.useful_habit.completion_count, 3)
+
+        Habit.objects.filter(pk=self.useful_habit.pk).update(last_completed_on=today - timedelta(days=5))
+        response = self.client.get(f'/habit/{self.useful_habit.pk}/progress/')
+        self.assertEqual(response.json()['current_streak'], 0)
+
+        stranger = User.objects.create(email='stranger@test.ru')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(stranger)}')
+        self.assertEqual(self.client.post(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_adherence_report(self):
+        today = timezone.localdate()
+        Habit.objects.filter(pk=self.useful_habit.pk).update(periodicity=2, time=timezone.now() - timedelta(days=13))
+        for days in (13, 11, 3):
+            HabitCompletion.objects.create(habit=self.useful_habit, day=today - timedelta(days=days))
+
+        report = self.client.get('/habit/report/').json()
+        self.assertEqual(len(report['weeks']), settings.HABIT_REPORT_WEEKS)
+        self.assertEqual((report['expected'], report['actual'], report['rate']), (7, 3, 0.429))
+        self.assertEqual([habit['id'] for habit in report['habits']], [self.useful_habit.pk])
+        self.assertEqual(sum(report['heatmap']), 3)
+        self.assertEqual(report['best_hour'], timezone.localtime().hour)
+        self.assertIsNone(report['weekly_rate'][0])
+
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/habit/{self.useful_habit.pk}/report/')
+        self.assertEqual(response.json()['rate'], 0.429)
+        self.assertEqual(self.client.get(f'/habit/{self.pleasure_habit.pk}/report/').status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+        self.client.post(f'/habit/{self.useful_habit.pk}/complete/', {'day': today - timedelta(days=1)})
+        self.assertEqual(self.client.get('/habit/report/').json()['actual'], 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch('/habit/bulk/update/', [{'id': self.useful_habit.pk, 'periodicity': 1}], format='json')
+        self.assertGreater(self.client.get('/habit/report/').json()['expected'], 7)
+        data = {'place': self.place.pk, 'action': self.action.pk, 'reward': 'yes'}
+        with self.captureOnCommitCallbacks(execute=True):
+            habit_id = self.client.post('/habit/create/', data).json()['id']
+        self.assertIn(habit_id, [habit['id'] for habit in self.client.get('/habit/report/').json()['habits']])
+
+        other_user = User.objects.create(email='other@test.ru')
+        Habit.objects.create(owner=other_user, place=self.place, action=self.action, reward='yes')
+        with override_settings(HABIT_REPORT_BATCH_SIZE=1), \
+                mock.patch.object(build_adherence_reports, 'delay') as delay:
+            self.assertEqual(precompute_adherence_reports(), 2)
+        self.assertEqual([call.args for call in delay.call_args_list], [([self.user.pk],), ([other_user.pk],)])
+        self.assertEqual(build_adherence_reports([self.user.pk]), 1)
+
+    def test_export_habits(self):
+        Habit.objects.create(owner=User.objects.create(email='other@test.ru'), place=self.place, action=self.action)
+        with mock.patch.object(settings, 'HABIT_EXPORT_CHUNK_SIZE', 1):
+            response = self.client.get('/habit/export/')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows], [self.useful_habit.pk, self.pleasure_habit.pk])
+        self.assertEqual(rows[0]['place'], self.place.pk)
+        self.assertNotIn('next_run', rows[0])
+
+        response = self.client.get('/habit/export/', {'file_format': 'csv', 'is_pleasure': 'true'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[0], 'id')
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith(f'{self.pleasure_habit.pk},'))
+
+        watermark = max(row['updated_at'] for row in rows)
+        self.client.patch('/habit/bulk/update/', [{'id': self.pleasure_habit.pk, 'execution_time': 30}], format='json')
+        response = self.client.get('/habit/export/', {'modified_since': watermark})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows], [self.pleasure_habit.pk])
+
+        response = self.client.get('/habit/export/', {'file_format': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_habit_object_permissions(self):
+        owner = User.objects.create(email='owner@test.ru')
+        stranger = User.objects.create(email='stranger@test.ru')
+        habit = Habit.objects.create(owner=owner, place=self.place, action=self.action, reward='yes')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(stranger)}')
+        self.assertEqual(self.client.get(f'/habit/{habit.pk}/').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.delete(f'/habit/{habit.pk}/delete/').status_code, status.HTTP_404_NOT_FOUND)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(owner)}')
+        self.assertQueryBudget(HabitRetrieveAPIView, f'/habit/{habit.pk}/')
+        response = self.client.patch(f'/habit/{habit.pk}/update/', {'reward': 'new_reward'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
     def test_update_habit(self):
         data = {'reward': 'new_reward', 'periodicity': 3, 'execution_time': 90}
         response = self.client.patch(f'/habit/{self.useful_habit.pk}/update/', data)
@@ -148,35 +553,326 @@ class HabitTestCase(APITestCase):
         self.assertEqual(response.json().get('periodicity'), data.get('periodicity'))
         self.assertEqual(response.json().get('execution_time'), data.get('execution_time'))
 
+    def test_update_habit_reschedule(self):
+        with mock.patch.object(reschedule_habit, 'apply_async') as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.patch(f'/habit/{self.useful_habit.pk}/update/', {'reward': 'new_reward'})
+            apply_async.assert_not_called()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.patch(f'/habit/{self.useful_habit.pk}/update/', {'periodicity': 3})
+                self.client.patch(f'/habit/{self.useful_habit.pk}/update/', {'periodicity': 4})
+            apply_async.assert_called_once()
+        reschedule_habit(self.useful_habit.pk)
+        self.useful_habit.refresh_from_db()
+        self.assertEqual(self.useful_habit.next_run, self.useful_habit.time + timedelta(days=4))
+
     def test_delete_habit(self):
         response = self.client.delete(f'/habit/{self.useful_habit.pk}/delete/')
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertFalse(Habit.objects.filter(pk=self.useful_habit.pk).exists())
 
+    def test_bulk_create_habits(self):
+        habits = [
+            {'place': self.place.pk, 'action': self.action.pk, 'reward': 'yes', 'periodicity': 2},
+            {'place': self.place.pk, 'action': self.action.pk, 'is_pleasure': True},
+        ]
+        response = self.client.post('/habit/bulk/create/', habits, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        created = Habit.objects.filter(pk__in=[habit['id'] for habit in response.json()])
+        self.assertEqual(len(created), 2)
+        self.assertTrue(all(habit.owner == self.user for habit in created))
+        self.assertEqual(created[0].next_run, created[0].time + timedelta(days=2))
+        self.assertIsNone(created[1].next_run)
+
+    def test_bulk_validation_queries(self):
+        data = [{'place': self.place.pk, 'action': self.action.pk, 'pleasure_habit': self.pleasure_habit.pk}] * 20
+        serializer = HabitSerializer(data=data, many=True)
+        with self.assertNumQueries(3):
+            self.assertTrue(serializer.is_valid())
+        data = [{'place': self.place.pk, 'action': self.action.pk, 'pleasure_habit': self.useful_habit.pk},
+                {'place': self.place.pk, 'action': 0, 'reward': 'yes'}]
+        serializer = HabitSerializer(data=data, many=True)
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('non_field_errors', serializer.errors[0])
+        self.assertIn('action', serializer.errors[1])
+        out = StringIO()
+        call_command('benchmark_validation', size=5, repeat=1, stdout=out)
+        self.assertIn('Пакетом', out.getvalue())
+
+    def test_bulk_update_habits(self):
+        data = [{'id': self.useful_habit.pk, 'periodicity': 3}, {'id': self.pleasure_habit.pk, 'is_public': True}]
+        response = self.client.patch('/habit/bulk/update/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.useful_habit.refresh_from_db()
+        self.assertEqual(self.useful_habit.periodicity, 3)
+        self.assertEqual(self.useful_habit.next_run, self.useful_habit.time + timedelta(days=3))
+        self.assertTrue(Habit.objects.get(pk=self.pleasure_habit.pk).is_public)
+        due = timezone.now() - timedelta(minutes=1)
+        Habit.objects.filter(pk=self.useful_habit.pk).update(next_run=due)
+        response = self.client.patch('/habit/bulk/update/', [{'id': self.useful_habit.pk, 'reward': 'autosave'}],
+                                     format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Habit.objects.get(pk=self.useful_habit.pk).next_run, due)
+        response = self.client.patch('/habit/bulk/update/', [{'id': 0, 'periodicity': 3}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        other_user = User.objects.create(email='other@test.ru', telegram_chat_id='1')
+        response = self.client.patch('/habit/bulk/update/', [{'id': self.useful_habit.pk, 'owner': other_user.pk}],
+                                     format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Habit.objects.get(pk=self.useful_habit.pk).owner, self.user)
+
+    def test_bulk_delete_habits(self):
+        self.useful_habit.pleasure_habit = self.pleasure_habit
+        self.useful_habit.save()
+        response = self.client.delete('/habit/bulk/delete/', {'ids': [self.pleasure_habit.pk]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        ids = [self.useful_habit.pk, self.pleasure_habit.pk]
+        response = self.client.delete('/habit/bulk/delete/', {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Habit.objects.filter(pk__in=ids).exists())
+
+    def test_query_budgets(self):
+        Habit.objects.bulk_create([
+            Habit(owner=self.user, place=self.place, action=self.action, pleasure_habit=self.pleasure_habit,
+                  is_public=True)
+            for _ in range(30)
+        ])
+        for view, path in (
+                (HabitListAPIView, '/habit/?page_size=30'),
+                (HabitPublicListAPIView, '/habit/public/?page_size=30'),
+                (HabitRetrieveAPIView, f'/habit/{self.useful_habit.pk}/'),
+        ):
+            with self.subTest(path=path):
+                self.assertQueryBudget(view, path)
+        with self.assertNumQueries(1):
+            [str(habit) for habit in Habit.objects.with_related()]
+
     def test_list_public_habits(self):
         public_habits = Habit.objects.filter(is_public=True)
-        response = self.client.get('/habit/public/')
+        response = self.client.get('/habit/public/?page=1')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.json().get('count'), len(public_habits))
 
-    def test_create_periodic_task(self):
-        self.assertFalse(PeriodicTask.objects.filter(name=self.useful_habit.pk).exists())
+    def test_list_public_habits_cache(self):
+        self.client.get('/habit/public/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/habit/public/')
+        self.assertEqual(response.json()['results'], [])
+        data = {'place': self.place.pk, 'action': self.action.pk, 'reward': 'yes', 'is_public': True}
+        with self.captureOnCommitCallbacks(execute=True):
+            habit_id = self.client.post('/habit/create/', data).json()['id']
+        response = self.client.get('/habit/public/')
+        self.assertEqual([habit['id'] for habit in response.json()['results']], [habit_id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/habit/{habit_id}/update/', {'is_public': False})
+        response = self.client.get('/habit/public/')
+        self.assertEqual(response.json()['results'], [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch('/habit/bulk/update/', [{'id': habit_id, 'is_public': True}], format='json')
+        response = self.client.get('/habit/public/')
+        self.assertEqual([habit['id'] for habit in response.json()['results']], [habit_id])
+
+    def test_list_public_habits_cursor(self):
+        habits = Habit.objects.bulk_create([
+            Habit(owner=self.user, place=self.place, action=self.action, reward='yes', is_public=True)
+            for _ in range(12)
+        ])
+        ids = []
+        path = '/habit/public/'
+        while path:
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.json())
+            ids += [habit['id'] for habit in response.json()['results']]
+            path = response.json()['next']
+            if len(ids) == 5:
+                Habit.objects.create(owner=self.user, place=self.place, action=self.action, is_public=True)
+        self.assertEqual(ids[:12], [habit.pk for habit in habits])
+        self.assertEqual(len(ids), 13)
+
+    def test_set_schedule(self):
+        self.assertIsNone(self.useful_habit.next_run)
         set_schedule(self.useful_habit)
-        self.assertTrue(PeriodicTask.objects.filter(name=self.useful_habit.pk).exists())
+        self.useful_habit.refresh_from_db()
+        self.assertEqual(self.useful_habit.next_run, self.useful_habit.time + timedelta(days=1))
+        set_schedule(self.pleasure_habit)
+        self.pleasure_habit.refresh_from_db()
+        self.assertIsNone(self.pleasure_habit.next_run)
 
-    def test_delete_periodic_task(self):
+    def test_collect_due_habits(self):
         set_schedule(self.useful_habit)
-        self.assertTrue(PeriodicTask.objects.filter(name=self.useful_habit.pk).exists())
-        delete_schedule(self.useful_habit.pk)
-        self.assertFalse(PeriodicTask.objects.filter(name=self.useful_habit.pk).exists())
-
-    def test_send_telegram_message(self):
-        target_timezone = pytz.timezone(settings.TIME_ZONE)
-        converted_datetime = self.useful_habit.time.astimezone(target_timezone)
-        kwargs = {
-            'chat_id': self.useful_habit.owner.telegram_chat_id,
-            'action': self.useful_habit.action.name,
+        self.assertEqual(list(collect_due_habits()), [])
+        now = timezone.now() + timedelta(days=1)
+        batches = list(collect_due_habits(now=now))
+        self.assertEqual([habit.pk for habits in batches for habit in habits], [self.useful_habit.pk])
+        self.useful_habit.refresh_from_db()
+        self.assertEqual(self.useful_habit.next_run, self.useful_habit.time + timedelta(days=2))
+        self.assertEqual(list(collect_due_habits(now=now)), [])
+
+    def test_reconcile_schedules(self):
+        stale_habit = Habit.objects.create(owner=self.user, place=self.place, action=self.action, reward='yes',
+                                           next_run=timezone.now() + timedelta(days=5))
+        Habit.objects.filter(pk=self.pleasure_habit.pk).update(next_run=timezone.now())
+        counts = reconcile_schedules(batch_size=1)
+        self.assertEqual((counts['missing'], counts['stale'], counts['orphaned']), (1, 1, 1))
+        self.assertFalse(Habit.objects.filter(is_pleasure=False, next_run__isnull=True).exists())
+        self.assertFalse(Habit.objects.filter(is_pleasure=True, next_run__isnull=False).exists())
+        stale_habit.refresh_from_db()
+        self.assertEqual(stale_habit.next_run, stale_habit.time + timedelta(days=1))
+        out = StringIO()
+        call_command('reconcile_schedules', stdout=out)
+        self.assertIn('Создано: 0, исправлено: 0, удалено: 0', out.getvalue())
+
+    def test_check_query_plans(self):
+        out = StringIO()
+        call_command('check_query_plans', seed=200, stdout=out)
+        self.assertEqual(out.getvalue().count(': OK'), len(HOT_QUERIES))
+        self.assertEqual(Habit.objects.count(), 2)
+
+    def test_resolve_reminders(self):
+        self.user.telegram_chat_id = 42
+        self.user.save()
+        converted_datetime = self.useful_habit.time.astimezone(pytz.timezone(settings.TIME_ZONE))
+        with self.assertNumQueries(3):
+            reminders = resolve_reminders([self.useful_habit.pk, self.pleasure_habit.pk])
+        self.assertEqual(reminders[self.useful_habit.pk], {
+            'chat_id': 42,
+            'action': self.action.name,
             'time': str(converted_datetime.time().replace(second=0, microsecond=0)),
-            'place': self.useful_habit.place.name
-        }
-        send_telegram_message.apply_async(kwargs=kwargs)
+            'place': self.place.name
+        })
+        with self.assertNumQueries(0):
+            resolve_reminders([self.useful_habit.pk])
+
+        self.place.name = 'Парк'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.place.save()
+        with self.assertNumQueries(1):
+            reminders = resolve_reminders([self.useful_habit.pk])
+        self.assertEqual(reminders[self.useful_habit.pk]['place'], 'Парк')
+
+    def test_reference_cache(self):
+        data = {'place': self.place.pk, 'action': self.action.pk, 'pleasure_habit': self.pleasure_habit.pk}
+        HabitSerializer(data=data).is_valid(raise_exception=True)
+        with self.assertNumQueries(1):
+            serializer = HabitSerializer(data=data)
+            serializer.is_valid(raise_exception=True)
+        self.assertEqual(serializer.validated_data['place'], self.place)
+
+        places.items.clear()
+        places.checked_at = 0
+        self.assertEqual(places.get(self.place.pk), self.place)
+        places.items[self.place.pk].name = 'Устарело'
+        places.checked_at = 0
+        bump_version(places.name)
+        with self.assertNumQueries(1):
+            self.assertEqual(places.get(self.place.pk).name, self.place.name)
+
+        version = get_version(places.name)
+        with self.captureOnCommitCallbacks() as callbacks:
+            Place.objects.filter(pk=self.place.pk).get().save()
+            self.assertEqual(get_version(places.name), version)
+        for callback in callbacks:
+            callback()
+        self.assertGreater(get_version(places.name), version)
+
+    def test_send_habit_reminders(self):
+        self.user.telegram_chat_id = 42
+        self.user.save()
+        reminders = [(self.useful_habit.pk, '2026-01-01T10:00:00+00:00'),
+                     (self.pleasure_habit.pk, '2026-01-01T10:00:00+00:00')]
+        with TelegramStubServer() as stub, override_settings(TELEGRAM_API_URL=stub.url):
+            self.assertEqual(send_habit_reminders(reminders), [200])
+            self.assertEqual(send_habit_reminders(reminders), [])
+        self.assertEqual(len(stub.received), 1)
+        self.assertEqual(stub.received[0][2]['chat_id'], ['42'])
+        self.assertEqual(stub.received[0][2]['text'][0].count(f'Я буду {self.action.name} в '), 2)
+
+    def test_send_habit_reminders_retry(self):
+        self.user.telegram_chat_id = 42
+        self.user.save()
+        reminders = [(self.useful_habit.pk, '2026-01-01T10:00:00+00:00')]
+        with TelegramStubServer(responses=[(500, {'ok': False})]) as stub, \
+                override_settings(TELEGRAM_API_URL=stub.url):
+            with self.assertRaises(Retry):
+                send_habit_reminders(reminders)
+            self.assertEqual(send_habit_reminders(reminders), [200])
+        self.assertEqual(stub.received[1][2]['text'][0], stub.received[0][2]['text'][0])
+        self.assertFalse(DeadLetter.objects.exists())
+
+    def test_send_habit_reminders_last_retry(self):
+        self.user.telegram_chat_id = 42
+        self.user.save()
+        reminders = [(self.useful_habit.pk, '2026-01-01T10:00:00+00:00')]
+        with TelegramStubServer(responses=[(500, {'ok': False})] * 2) as stub, \
+                override_settings(TELEGRAM_API_URL=stub.url):
+            send_habit_reminders.apply((reminders,), retries=3)
+            self.assertEqual(len(stub.received), 3)
+            self.assertFalse(DeadLetter.objects.exists())
+            stub.server.responses.append((500, {'ok': False}))
+            reminders = [(self.useful_habit.pk, '2026-01-02T10:00:00+00:00')]
+            result = send_habit_reminders.apply((reminders,), retries=settings.TELEGRAM_MAX_RETRIES)
+        self.assertEqual(result.get(), [500])
+        dead_letter = DeadLetter.objects.get()
+        self.assertEqual((dead_letter.status_code, dead_letter.attempts), (500, settings.TELEGRAM_MAX_RETRIES + 1))
+
+    def test_delivery_metrics(self):
+        self.user.telegram_chat_id = 42
+        self.user.save()
+        reminders = [(self.useful_habit.pk, (timezone.now() - timedelta(seconds=3)).isoformat())]
+        with TelegramStubServer() as stub, override_settings(TELEGRAM_API_URL=stub.url):
+            send_habit_reminders(reminders, dispatched_at=time.time() - 0.2)
+        self.assertEqual(get_histogram('habit_reminder_lag_seconds')['buckets'][get_bucket(3)], 1)
+        self.assertEqual(get_histogram('habit_reminder_queue_wait_seconds')['buckets'][get_bucket(0.2)], 1)
+        self.assertEqual(get_histogram('habit_telegram_send_seconds')['count'], 1)
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('habit_reminders_sent_total 1', response.content.decode())
+        out = StringIO()
+        call_command('metrics_summary', minutes=1, stdout=out)
+        self.assertIn('p50 <= 5 с', out.getvalue())
+
+    def test_dead_letters(self):
+        self.user.telegram_chat_id = 42
+        self.user.save()
+        reminders = [(self.useful_habit.pk, '2026-01-01T10:00:00+00:00')]
+        with TelegramStubServer(responses=[(403, {'ok': False, 'description': 'Forbidden'})]) as stub, \
+                override_settings(TELEGRAM_API_URL=stub.url):
+            self.assertEqual(send_habit_reminders(reminders), [403])
+        dead_letter = DeadLetter.objects.get()
+        self.assertEqual((dead_letter.chat_id, dead_letter.status_code, dead_letter.error), (42, 403, 'Forbidden'))
+        self.assertEqual(dead_letter.reminders, [list(reminders[0])])
+        with mock.patch.object(send_habit_reminders, 'delay') as delay:
+            self.assertEqual(replay_dead_letters(DeadLetter.objects.all()), 1)
+        delay.assert_called_once_with([list(reminders[0])])
+        self.assertFalse(DeadLetter.objects.exists())
+
+    def test_deliver_reminders_command(self):
+        self.user.telegram_chat_id = 42
+        self.user.save()
+        other_user = User.objects.create(email='other@test.ru', telegram_chat_id=43)
+        other_habit = Habit.objects.create(owner=other_user, place=self.place, action=self.action, reward='yes')
+        Habit.objects.filter(pk__in=[self.useful_habit.pk, other_habit.pk]).update(
+            next_run=timezone.now() - timedelta(minutes=1))
+        responses = [(429, {'ok': False, 'parameters': {'retry_after': 7}}), (403, {'ok': False})]
+        with TelegramStubServer(responses=responses) as stub, \
+                override_settings(TELEGRAM_API_URL=stub.url, HABIT_DELIVERY_CONCURRENCY=1):
+            out = StringIO()
+            call_command('deliver_reminders', once=True, stdout=out, stderr=StringIO())
+        self.assertIn('Отправлено: 0, отложено: 1, ошибок: 1', out.getvalue())
+        self.assertEqual(sorted(DeadLetter.objects.values_list('status_code', 'attempts')), [(403, 1), (429, 1)])
+
+    def test_deliver_reminders_command_retry(self):
+        self.user.telegram_chat_id = 42
+        self.user.save()
+        for max_retries, expected in ((5, 'Отправлено: 1, отложено: 0, ошибок: 0'),
+                                      (1, 'Отправлено: 0, отложено: 0, ошибок: 1')):
+            Habit.objects.filter(pk=self.useful_habit.pk).update(next_run=timezone.now() - timedelta(minutes=1))
+            with TelegramStubServer(responses=[(500, {'ok': False})] * 2) as stub, \
+                    override_settings(TELEGRAM_API_URL=stub.url, TELEGRAM_MAX_RETRIES=max_retries), \
+                    mock.patch('habit.management.commands.deliver_reminders.get_retry_countdown', return_value=0):
+                out = StringIO()
+                call_command('deliver_reminders', once=True, stdout=out, stderr=StringIO())
+            self.assertIn(expected, out.getvalue())
+            self.assertEqual(len(stub.received), min(max_retries + 1, 3))
+        self.assertEqual(list(DeadLetter.objects.values_list('status_code', 'attempts')), [(500, 2)])
@@ -2,7 +2,9 @@ from django.urls import path
 from rest_framework import routers
 from habit.apps import HabitConfig
 from habit.views import PlaceViewSet, ActionViewSet, HabitListAPIView, HabitPublicListAPIView, HabitCreateAPIView, \
-    HabitRetrieveAPIView, HabitUpdateAPIView, HabitDestroyAPIView
+    HabitRetrieveAPIView, HabitUpdateAPIView, HabitDestroyAPIView, HabitBulkCreateAPIView, HabitBulkUpdateAPIView, \
+    HabitBulkDestroyAPIView, HabitCompleteAPIView, HabitProgressAPIView, HabitReportAPIView, \
+    HabitReportRetrieveAPIView, HabitExportAPIView, HabitAgendaAPIView, MetricsAPIView
 
 app_name = HabitConfig.name
 
@@ -13,8 +15,18 @@ router.register(r'actions', ActionViewSet, basename='actions')
 urlpatterns = [
     path('habit/', HabitListAPIView.as_view(), name='habit_list'),
     path('habit/public/', HabitPublicListAPIView.as_view(), name='habit_public_list'),
+    path('habit/agenda/', HabitAgendaAPIView.as_view(), name='habit_agenda'),
     path('habit/create/', HabitCreateAPIView.as_view(), name='habits_list'),
     path('habit/<int:pk>/', HabitRetrieveAPIView.as_view(), name='habit'),
     path('habit/<int:pk>/update/', HabitUpdateAPIView.as_view(), name='habit_update'),
     path('habit/<int:pk>/delete/', HabitDestroyAPIView.as_view(), name='habit_delete'),
+    path('habit/<int:pk>/complete/', HabitCompleteAPIView.as_view(), name='habit_complete'),
+    path('habit/<int:pk>/progress/', HabitProgressAPIView.as_view(), name='habit_progress'),
+    path('habit/<int:pk>/report/', HabitReportRetrieveAPIView.as_view(), name='habit_report'),
+    path('habit/report/', HabitReportAPIView.as_view(), name='habit_report_list'),
+    path('habit/bulk/create/', HabitBulkCreateAPIView.as_view(), name='habit_bulk_create'),
+    path('habit/bulk/update/', HabitBulkUpdateAPIView.as_view(), name='habit_bulk_update'),
+    path('habit/bulk/delete/', HabitBulkDestroyAPIView.as_view(), name='habit_bulk_delete'),
+    path('habit/export/', HabitExportAPIView.as_view(), name='habit_export'),
+    path('metrics/', MetricsAPIView.as_view(), name='metrics'),
 ] + router.urls
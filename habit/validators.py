@@ -1,6 +1,6 @@
 from rest_framework.serializers import ValidationError
 
-from habit.models import Habit
+from habit.models import MAX_PERIODICITY
 
 
 class RewardValidator:
@@ -8,7 +8,6 @@ class RewardValidator:
         self.fields = fields_list
 
     def __call__(self, value):
-        print(value)
         if not value.get('is_pleasure'):
             if not value.get(self.fields[0]) and not value.get(self.fields[1]):
                 raise ValidationError("У привычки должно быть вознаграждение или связанная привычка!")
@@ -31,9 +30,7 @@ class PleasureHabitValidator:
 
     def __call__(self, value):
         if value.get(self.field):
-            habit_pk = dict(value).get(self.field).pk
-            habit = Habit.objects.get(pk=habit_pk)
-            if not habit.is_pleasure:
+            if not value.get(self.field).is_pleasure:
                 raise ValidationError(
                     "В связанные привычки могут попадать только привычки с признаком приятной привычки!")
 
@@ -53,8 +50,8 @@ class PeriodicityValidator:
         self.field = field
 
     def __call__(self, value):
-        if self.field in value and value.get(self.field) > 7:
-            raise ValidationError("Нельзя выполнять привычку реже, чем 1 раз в 7 дней!")
+        if self.field in value and value.get(self.field) > MAX_PERIODICITY:
+            raise ValidationError(f"Нельзя выполнять привычку реже, чем 1 раз в {MAX_PERIODICITY} дней!")
 
 
 def patch_validator(habit, validated_data):
@@ -1,25 +1,118 @@
-from rest_framework import viewsets, generics
-from rest_framework.permissions import IsAuthenticated
+import hashlib
 
+from django.db import transaction
+from django.db.models import ProtectedError
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import viewsets, generics, status
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from config import settings
+
+from habit.cache import get_version, get_versions, add_versions, delete_versions, get_or_compute, \
+    invalidate_public_feed
+from habit.metrics import render_prometheus
 from habit.models import Place, Action, Habit
 from habit.pagination import PlacePagination, ActionPagination, HabitPagination
 from habit.permissions import IsUserOrStaff
-from habit.serializers import PlaceSerializer, ActionSerializer, HabitSerializer
-from habit.services import set_schedule, delete_schedule
+from habit.reference import places, actions
+from habit.reports import get_adherence_report
+from habit.renderers import FastJSONRenderer, stream_ndjson, stream_csv
+from habit.serializers import PlaceSerializer, ActionSerializer, HabitSerializer, HabitIdsSerializer, \
+    HabitExportSerializer, HabitExportQuerySerializer, HabitCompletionSerializer, HabitProgressSerializer, \
+    HabitAgendaSerializer, HabitAgendaQuerySerializer, \
+    get_value_columns, serialize_values, iter_values
+from habit.services import set_schedule, is_schedule_changed, complete_habit, get_progress, get_agenda
+from habit.tasks import request_reschedule
+
+
+class ConditionalGetMixin:
+    version_names = ()
+
+    def get_version_names(self):
+        return self.version_names
+
+    def get_conditional_response(self, request, handler, *args, **kwargs):
+        names = self.get_version_names()
+        versions = get_versions(names)
+        missing = [name for name, version in zip(names, versions) if version is None]
+        added = []
+        if missing:
+            added = add_versions(missing)
+            versions = get_versions(names)
+        if None in versions:
+            return handler(request, *args, **kwargs)
+        last_modified = max(versions)
+        etag = quote_etag(hashlib.md5(
+            f'{request.user.pk}:{request.accepted_renderer.format}:{request.get_full_path()}:{versions}'.encode()
+        ).hexdigest())
+        response = None if missing else get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            try:
+                response = handler(request, *args, **kwargs)
+            finally:
+                if added and (response is None or response.status_code != status.HTTP_200_OK):
+                    delete_versions(added)
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.get_conditional_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_conditional_response(request, super().retrieve, *args, **kwargs)
+
 
+class FastListMixin:
 
-class PlaceViewSet(viewsets.ModelViewSet):
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        if settings.HABIT_FAST_SERIALIZATION:
+            renderers = [FastJSONRenderer() if type(renderer) is JSONRenderer else renderer for renderer in renderers]
+        return renderers
+
+    def list(self, request, *args, **kwargs):
+        if not settings.HABIT_FAST_SERIALIZATION:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        columns = get_value_columns(self.get_serializer(), queryset.model)
+        rows = queryset.values(*[source for name, source, convert in columns])
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serialize_values(page, columns))
+        return Response(serialize_values(rows, columns))
+
+
+class PlaceViewSet(ConditionalGetMixin, FastListMixin, viewsets.ModelViewSet):
     permission_classes = (IsAuthenticated,)
     queryset = Place.objects.all()
     serializer_class = PlaceSerializer
     pagination_class = PlacePagination
+    version_names = (places.name,)
 
 
-class ActionViewSet(viewsets.ModelViewSet):
+class ActionViewSet(ConditionalGetMixin, FastListMixin, viewsets.ModelViewSet):
     permission_classes = (IsAuthenticated,)
     queryset = Action.objects.all()
     serializer_class = ActionSerializer
     pagination_class = ActionPagination
+    version_names = (actions.name,)
+
+
+class OwnerQuerySetMixin:
+
+    def get_queryset(self):
+        queryset = Habit.objects.with_related()
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(owner=self.request.user)
+        return queryset
 
 
 class HabitCreateAPIView(generics.CreateAPIView):
@@ -27,52 +120,217 @@ class HabitCreateAPIView(generics.CreateAPIView):
     serializer_class = HabitSerializer
 
     def perform_create(self, serializer, **kwargs):
-        new_habit = serializer.save()
-        new_habit.owner = self.request.user
-        new_habit.save()
-
+        new_habit = serializer.save(owner=self.request.user)
         set_schedule(habit=new_habit)
 
 
-class HabitListAPIView(generics.ListAPIView):
+class HabitListAPIView(ConditionalGetMixin, FastListMixin, generics.ListAPIView):
     permission_classes = (IsAuthenticated,)
     serializer_class = HabitSerializer
     pagination_class = HabitPagination
+    query_budget = 2
+
+    def get_version_names(self):
+        return (f'habits:{self.request.user.pk}',)
 
     def get_queryset(self):
-        queryset = Habit.objects.filter(owner=self.request.user)
+        queryset = Habit.objects.with_related().filter(owner=self.request.user)
         return queryset
 
 
-class HabitPublicListAPIView(generics.ListAPIView):
+class HabitPublicListAPIView(ConditionalGetMixin, FastListMixin, generics.ListAPIView):
     permission_classes = (IsAuthenticated,)
-    queryset = Habit.objects.filter(is_public=True)
+    queryset = Habit.objects.with_related().filter(is_public=True)
     serializer_class = HabitSerializer
     pagination_class = HabitPagination
+    query_budget = 2
+    version_names = ('public-feed',)
+
+    def list(self, request, *args, **kwargs):
+        return self.get_conditional_response(request, self.list_cached, *args, **kwargs)
+
+    def list_cached(self, request, *args, **kwargs):
+        key = f'public-feed:{get_version("public-feed")}:{request.build_absolute_uri()}'
+        data = get_or_compute(key, lambda: FastListMixin.list(self, request, *args, **kwargs).data,
+                              settings.HABIT_PUBLIC_FEED_TIMEOUT)
+        return Response(data)
 
 
-class HabitRetrieveAPIView(generics.RetrieveAPIView):
+class HabitAgendaAPIView(generics.GenericAPIView):
+    permission_classes = (IsAuthenticated,)
+    serializer_class = HabitAgendaSerializer
+    query_budget = 1
+
+    def get(self, request, *args, **kwargs):
+        query_serializer = HabitAgendaQuerySerializer(data=request.query_params.dict())
+        query_serializer.is_valid(raise_exception=True)
+        start, end = query_serializer.validated_data['start'], query_serializer.validated_data['end']
+        habits = get_agenda(Habit.objects.agenda(request.user.pk), start, end)
+        return Response(self.get_serializer(habits, many=True).data)
+
+
+class HabitRetrieveAPIView(ConditionalGetMixin, OwnerQuerySetMixin, generics.RetrieveAPIView):
     permission_classes = (IsAuthenticated, IsUserOrStaff,)
-    queryset = Habit.objects.all()
     serializer_class = HabitSerializer
+    query_budget = 2
 
+    def get_version_names(self):
+        if self.request.user.is_staff:
+            return (f'habit:{self.kwargs["pk"]}',)
+        return (f'habit:{self.request.user.pk}:{self.kwargs["pk"]}',)
 
-class HabitUpdateAPIView(generics.UpdateAPIView):
+
+class HabitUpdateAPIView(OwnerQuerySetMixin, generics.UpdateAPIView):
     permission_classes = (IsAuthenticated, IsUserOrStaff,)
-    queryset = Habit.objects.all()
     serializer_class = HabitSerializer
 
     def perform_update(self, serializer):
+        schedule_changed = is_schedule_changed(serializer.instance, serializer.validated_data)
+        was_public = serializer.instance.is_public
         habit = serializer.save()
-        delete_schedule(habit_pk=habit.pk)
-        set_schedule(habit=habit)
+        if was_public:
+            invalidate_public_feed()
+        if schedule_changed:
+            request_reschedule(habit.pk)
 
 
-class HabitDestroyAPIView(generics.DestroyAPIView):
+class HabitDestroyAPIView(OwnerQuerySetMixin, generics.DestroyAPIView):
     permission_classes = (IsAuthenticated, IsUserOrStaff,)
-    queryset = Habit.objects.all()
     serializer_class = HabitSerializer
 
-    def perform_destroy(self, instance):
-        delete_schedule(habit_pk=instance.pk)
-        super().perform_destroy(instance)
+
+class HabitCompleteAPIView(OwnerQuerySetMixin, generics.GenericAPIView):
+    permission_classes = (IsAuthenticated, IsUserOrStaff,)
+    serializer_class = HabitCompletionSerializer
+
+    def post(self, request, *args, **kwargs):
+        habit = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        completion = complete_habit(habit.pk, serializer.validated_data['day'])
+        if completion is None:
+            raise ValidationError('Привычка уже отмечена выполненной в этот или более поздний день!')
+        return Response(self.get_serializer(completion).data, status=status.HTTP_201_CREATED)
+
+
+class HabitProgressAPIView(OwnerQuerySetMixin, generics.RetrieveAPIView):
+    permission_classes = (IsAuthenticated, IsUserOrStaff,)
+    serializer_class = HabitProgressSerializer
+    query_budget = 1
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(self.get_serializer(get_progress(self.get_object())).data)
+
+
+class HabitReportAPIView(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request, *args, **kwargs):
+        return Response(get_adherence_report(request.user.pk))
+
+
+class HabitReportRetrieveAPIView(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request, pk, *args, **kwargs):
+        report = get_adherence_report(request.user.pk)
+        habit_report = next((habit for habit in report['habits'] if habit['id'] == pk), None)
+        if habit_report is None:
+            raise NotFound('Привычка не найдена!')
+        return Response({'weeks': report['weeks'], **habit_report})
+
+
+class HabitExportAPIView(generics.GenericAPIView):
+    permission_classes = (IsAuthenticated,)
+    serializer_class = HabitExportSerializer
+
+    def get(self, request, *args, **kwargs):
+        query_serializer = HabitExportQuerySerializer(data=request.query_params.dict())
+        query_serializer.is_valid(raise_exception=True)
+        params = query_serializer.validated_data
+
+        queryset = Habit.objects.filter(owner=request.user).order_by('pk')
+        for field in ('is_public', 'is_pleasure'):
+            if field in params:
+                queryset = queryset.filter(**{field: params[field]})
+        if 'modified_since' in params:
+            queryset = queryset.filter(updated_at__gt=params['modified_since'])
+
+        serializer = self.get_serializer()
+        rows = iter_values(queryset, serializer, settings.HABIT_EXPORT_CHUNK_SIZE)
+        if params['file_format'] == 'csv':
+            response = StreamingHttpResponse(stream_csv(list(serializer.fields), rows), content_type='text/csv')
+        else:
+            response = StreamingHttpResponse(stream_ndjson(rows), content_type='application/x-ndjson')
+        response['Content-Disposition'] = f'attachment; filename="habits.{params["file_format"]}"'
+        return response
+
+
+class HabitBulkCreateAPIView(generics.CreateAPIView):
+    permission_classes = (IsAuthenticated,)
+    serializer_class = HabitSerializer
+
+    def get_serializer(self, *args, **kwargs):
+        return super().get_serializer(*args, many=True, max_length=settings.HABIT_BULK_MAX_SIZE, **kwargs)
+
+    def perform_create(self, serializer):
+        habits = serializer.save(owner=self.request.user)
+        if any(habit.is_public for habit in habits):
+            invalidate_public_feed()
+
+
+class HabitBulkUpdateAPIView(OwnerQuerySetMixin, generics.GenericAPIView):
+    permission_classes = (IsAuthenticated,)
+    serializer_class = HabitSerializer
+
+    def update(self, request, partial):
+        if not isinstance(request.data, list) or not all(isinstance(item, dict) for item in request.data):
+            raise ValidationError('Ожидается список привычек с полем id!')
+        ids_serializer = HabitIdsSerializer(data={'ids': [item.get('id') for item in request.data]})
+        ids_serializer.is_valid(raise_exception=True)
+        ids = ids_serializer.validated_data['ids']
+        if len(set(ids)) != len(ids):
+            raise ValidationError('Привычки в списке не должны повторяться!')
+
+        habits = self.get_queryset().in_bulk(ids)
+        missing = [pk for pk in ids if pk not in habits]
+        if missing:
+            raise NotFound(f'Привычки не найдены: {missing}')
+
+        serializer = self.get_serializer([habits[pk] for pk in ids], data=request.data, many=True, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        was_public = any(habit.is_public for habit in habits.values())
+        serializer.save()
+        if was_public or any(habit.is_public for habit in habits.values()):
+            invalidate_public_feed()
+        return Response(serializer.data)
+
+    def put(self, request, *args, **kwargs):
+        return self.update(request, partial=False)
+
+    def patch(self, request, *args, **kwargs):
+        return self.update(request, partial=True)
+
+
+class HabitBulkDestroyAPIView(OwnerQuerySetMixin, generics.GenericAPIView):
+    permission_classes = (IsAuthenticated,)
+    serializer_class = HabitIdsSerializer
+
+    def delete(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        habits = self.get_queryset().filter(pk__in=serializer.validated_data['ids'])
+        try:
+            with transaction.atomic():
+                habits.filter(is_pleasure=False).delete()
+                habits.delete()
+        except ProtectedError:
+            raise ValidationError('Нельзя удалить приятную привычку, которая связана с другой привычкой!')
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class MetricsAPIView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4')
@@ -0,0 +1,60 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from users.models import User
+
+PRINCIPAL_FIELDS = ('pk', 'email', 'is_active', 'is_staff', 'is_superuser', 'telegram_chat_id')
+
+principals = {}
+
+
+def get_principal(user_id):
+    entry = principals.get(user_id)
+    if entry is not None and entry[0] > time.monotonic():
+        return entry[1]
+
+    key = f'principal:{user_id}'
+    record = cache.get(key)
+    if record is None:
+        record = User.objects.filter(pk=user_id).values(*PRINCIPAL_FIELDS).first() or {}
+        cache.set(key, record, settings.AUTH_PRINCIPAL_CACHE_TIMEOUT)
+    if len(principals) >= settings.AUTH_PRINCIPAL_LOCAL_CACHE_SIZE:
+        principals.clear()
+    principals[user_id] = (time.monotonic() + settings.AUTH_PRINCIPAL_LOCAL_CACHE_TIMEOUT, record)
+    return record
+
+
+def build_principal(record):
+    # request.user carries only PRINCIPAL_FIELDS: other fields are deferred and loaded on access,
+    # and save() writes back only the loaded fields.
+    values = {**record, User._meta.pk.attname: record['pk']}
+    fields = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+    return User.from_db(DEFAULT_DB_ALIAS, fields, [values[name] for name in fields])
+
+
+def invalidate_principal(user_id):
+    principals.pop(user_id, None)
+    cache.delete(f'principal:{user_id}')
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Токен не содержит идентификатор пользователя')
+
+        record = get_principal(user_id)
+        if not record:
+            raise AuthenticationFailed('Пользователь не найден', code='user_not_found')
+        if not record['is_active']:
+            raise AuthenticationFailed('Пользователь неактивен', code='user_inactive')
+        return build_principal(record)
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
 from users.models import User
 
@@ -22,3 +23,43 @@ class UserSerializer(serializers.ModelSerializer):
         instance.set_password(validated_data['password'])
         instance.save()
         return instance
+
+
+class UserDirectorySerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = User
+        fields = ('pk', 'email', 'first_name', 'last_name', 'telegram_chat_id', 'is_active', 'is_staff',
+                  'date_joined', 'last_login')
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class UserDirectoryQuerySerializer(serializers.Serializer):
+    email = serializers.CharField(required=False, max_length=255)
+    is_active = serializers.BooleanField(required=False)
+    is_staff = serializers.BooleanField(required=False)
+    fields = serializers.CharField(required=False)
+
+    def validate_fields(self, value):
+        fields = [field.strip() for field in value.split(',') if field.strip()]
+        unknown = [field for field in fields if field not in UserDirectorySerializer.Meta.fields]
+        if not fields or unknown:
+            raise serializers.ValidationError(
+                f'Допустимые поля: {", ".join(UserDirectorySerializer.Meta.fields)}')
+        return fields
+
+
+class UserTokenObtainPairSerializer(TokenObtainPairSerializer):
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['pk'] = user.pk
+        token['is_staff'] = user.is_staff
+        token['telegram_chat_id'] = user.telegram_chat_id
+        return token
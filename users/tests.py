@@ -1,3 +1,103 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APITestCase, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+from users.authentication import CachedJWTAuthentication
+from users.models import User
+
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class UserAuthenticationTestCase(APITestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create(email='test@test.ru', telegram_chat_id=42, is_staff=True)
+        self.user.set_password('0000')
+        self.user.save()
+
+    def authenticate(self, token):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return CachedJWTAuthentication().authenticate(request)[0]
+
+    def test_token_claims(self):
+        response = self.client.post('/users/token/', {'email': 'test@test.ru', 'password': '0000'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        token = AccessToken(response.json()['access'])
+        self.assertEqual(token['pk'], self.user.pk)
+        self.assertTrue(token['is_staff'])
+        self.assertEqual(token['telegram_chat_id'], 42)
+
+    def test_cached_principal(self):
+        token = AccessToken.for_user(self.user)
+        self.authenticate(token)
+        with self.assertNumQueries(0):
+            user = self.authenticate(token)
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertTrue(user.is_staff)
+        self.assertEqual(user.telegram_chat_id, 42)
+        self.assertFalse(user._state.adding)
+
+        User.objects.filter(pk=self.user.pk).update(first_name='Иван')
+        user.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(user.first_name, 'Иван')
+        self.assertTrue(User.objects.get(pk=self.user.pk).check_password('0000'))
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        response = self.client.put(f'/users/{self.user.pk}/update/', {'email': 'new@test.ru', 'password': '1111'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.authenticate(token).email, 'new@test.ru')
+
+        self.user.refresh_from_db()
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+        self.user.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class UserDirectoryTestCase(APITestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.admin = User.objects.create(email='admin@test.ru', is_staff=True)
+        User.objects.bulk_create([User(email=f'user{index}@test.ru') for index in range(5)])
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.admin)}')
+
+    def test_permissions(self):
+        user = User.objects.get(email='user0@test.ru')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        self.assertEqual(self.client.get('/users/').status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_user_directory(self):
+        response = self.client.get('/users/', {'page_size': 2, 'email': 'user'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([user['email'] for user in response.json()['results']], ['user0@test.ru', 'user1@test.ru'])
+        self.assertNotIn('password', response.json()['results'][0])
+
+        emails = []
+        url = response.json()['next']
+        while url:
+            response = self.client.get(url)
+            emails += [user['email'] for user in response.json()['results']]
+            url = response.json()['next']
+        self.assertEqual(emails, ['user2@test.ru', 'user3@test.ru', 'user4@test.ru'])
+
+        response = self.client.get('/users/', {'fields': 'pk,email', 'is_staff': 'true'})
+        self.assertEqual(response.json()['results'], [{'pk': self.admin.pk, 'email': 'admin@test.ru'}])
+        self.assertEqual(self.client.get('/users/', {'fields': 'password'}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
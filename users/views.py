@@ -1,6 +1,9 @@
 from rest_framework import generics
+from rest_framework.permissions import IsAdminUser
+
 from users.models import User
-from users.serializers import UserSerializer
+from users.pagination import UserPagination
+from users.serializers import UserSerializer, UserDirectorySerializer, UserDirectoryQuerySerializer
 
 
 class UserRegister(generics.CreateAPIView):
@@ -8,8 +11,32 @@ class UserRegister(generics.CreateAPIView):
 
 
 class UserListAPIView(generics.ListAPIView):
-    queryset = User.objects.all()
-    serializer_class = UserSerializer
+    permission_classes = (IsAdminUser,)
+    serializer_class = UserDirectorySerializer
+    pagination_class = UserPagination
+
+    def get_query_params(self):
+        if not hasattr(self, 'directory_params'):
+            serializer = UserDirectoryQuerySerializer(data=self.request.query_params.dict())
+            serializer.is_valid(raise_exception=True)
+            self.directory_params = serializer.validated_data
+        return self.directory_params
+
+    def get_queryset(self):
+        params = self.get_query_params()
+        queryset = User.objects.all()
+        if 'email' in params:
+            queryset = queryset.filter(email__startswith=params['email'])
+        for field in ('is_active', 'is_staff'):
+            if field in params:
+                queryset = queryset.filter(**{field: params[field]})
+        if 'fields' in params:
+            queryset = queryset.only(*[User._meta.pk.name if field == 'pk' else field for field in params['fields']])
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.get_query_params().get('fields'))
+        return super().get_serializer(*args, **kwargs)
 
 
 class UserRetrieveAPIView(generics.RetrieveAPIView):